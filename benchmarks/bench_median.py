@@ -0,0 +1,91 @@
+"""Exact pandas medians vs. approximate medians merged from the cube's wage sketches.
+
+Times the two median paths of the dashboard (trend by YEAR, scatter by JOB_TITLE and by
+EMPLOYER_NAME after a year brush) on the synthetic petitions of `benchmarks/synthetic.py`,
+prepared as the dashboard prepares them, and reports the relative error of the sketch
+medians for each sketch accuracy, as one JSON object per line:
+
+    python benchmarks/bench_median.py --rows 2000000 --accuracy 0.05 0.01 0.005
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import CHUNK_ROWS, make_chunk, write_cities_csv  # noqa: E402
+from h1b.cube import build_cube, rollup_quantile, select_years  # noqa: E402
+from h1b.ingest import CITY_DTYPES, concat_chunks, prepare_data  # noqa: E402
+from h1b.settings import OUTLIERS_BY  # noqa: E402
+
+
+def make_petitions(rows, seed=0):
+    """Prepared petitions from the synthetic CSVs' rows, as the dashboard would load them."""
+    chunks = [make_chunk(min(CHUNK_ROWS, rows - offset), seed, index)
+              for index, offset in enumerate(range(0, rows, CHUNK_ROWS))]
+    with tempfile.TemporaryDirectory() as tmp:
+        city_path = os.path.join(tmp, "us_cities.csv")
+        write_cities_csv(city_path, seed)
+        city_df = pd.read_csv(city_path, dtype=CITY_DTYPES)
+    return prepare_data(concat_chunks(chunks), city_df, OUTLIERS_BY)
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--accuracy", type=float, nargs="+", default=[0.05, 0.01, 0.005])
+    parser.add_argument("--years", type=int, nargs="+", default=[2019, 2020, 2021],
+                        help="brush selection applied before the scatter medians")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_petitions(args.rows)
+    queries = {"trend": (["YEAR"], None),
+               "scatter_job_title": (["JOB_TITLE"], args.years),
+               "scatter_employer": (["EMPLOYER_NAME"], args.years)}
+
+    for accuracy in args.accuracy:
+        cube, build_seconds = timed(lambda: build_cube(df, accuracy), 1)
+        for name, (by, years) in queries.items():
+            def exact():
+                rows = df if years is None else df[df["YEAR"].isin(years)]
+                return rows.groupby(by, observed=True)["PREVAILING_WAGE"].median()
+
+            def approximate():
+                selected = cube if years is None else select_years(cube, years)
+                return rollup_quantile(selected, by, 0.5).set_index(by)["quantile"]
+
+            expected, exact_seconds = timed(exact, args.repeat)
+            estimate, approximate_seconds = timed(approximate, args.repeat)
+            error = ((estimate - expected.loc[estimate.index]).abs()
+                     / expected.loc[estimate.index])
+            print(json.dumps({
+                "query": name,
+                "rows": args.rows,
+                "accuracy": accuracy,
+                "groups": len(expected),
+                "cube_cells": len(cube.cells),
+                "cube_build_seconds": round(build_seconds, 4),
+                "exact_seconds": round(exact_seconds, 4),
+                "approximate_seconds": round(approximate_seconds, 4),
+                "max_relative_error": round(float(error.max()), 6),
+                "mean_relative_error": round(float(error.mean()), 6),
+            }))
+
+
+if __name__ == "__main__":
+    main()
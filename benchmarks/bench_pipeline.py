@@ -0,0 +1,160 @@
+"""Per-stage timings of the dashboard pipeline on synthetic data of several sizes.
+
+For each size, generates (once) a synthetic h1b_data.csv and us_cities.csv, then times
+every stage the dashboard runs through: loading the CSV, the wage moments and outlier cut
+(the z-score), the city merge (geocoding), the cube, the year brush filter, and each
+panel's aggregation and chart serialization (spec and data), brushed and unbrushed.
+Aggregations are timed cold, with every cache cleared. Prints one JSON object per stage and size:
+
+    python benchmarks/bench_pipeline.py --rows 1000000 10000000 50000000 > results.jsonl
+"""
+import argparse
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import write_dataset  # noqa: E402
+from h1b import charts, views  # noqa: E402
+from h1b.cube import build_cube, select_years  # noqa: E402
+from h1b.data import cube_version  # noqa: E402
+from h1b.ingest import (CACHE_DIR, CITY_DTYPES, H1B_DTYPES, city_index,  # noqa: E402
+                        concat_chunks, drop_outliers, iter_source, prepare_chunk, read_source,
+                        wage_moments)
+from h1b.partition import take_years  # noqa: E402
+from h1b.persist import VIEW_CACHE_DIR  # noqa: E402
+from h1b.settings import MAP_MAX_POINTS, OUTLIERS_BY, SKETCH_ACCURACY  # noqa: E402
+from h1b.transport import arrow_bytes  # noqa: E402
+
+
+def _cold(builder):
+    # The view builder itself, run with every in-memory and on-disk cache cleared
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    shutil.rmtree(VIEW_CACHE_DIR, ignore_errors=True)
+    return inspect.unwrap(builder)
+
+
+def _chart_specs(measure, category, panels):
+    # The panels' charts as dashboard.py sends them: spec templates with their datasets
+    map_data, _ = panels["map"]
+    box_stats, box_outliers = panels["boxplot"]
+    return {
+        "bar": (charts.bar(measure, category), {"bar": panels["bar"]}),
+        "map": (charts.city_map(measure, "states.json"), {"map": map_data}),
+        "boxplot": (charts.boxplot_summary(measure),
+                    {"stats": box_stats, "outliers": box_outliers}),
+        "scatter": (charts.scatter(views.COUNT, views.WAGE, category),
+                    {"scatter": panels["scatter"]}),
+    }
+
+
+def _send(template, datasets):
+    # What a rerun serializes per chart: the spec as JSON, each dataset as Arrow
+    return json.dumps(template), [arrow_bytes(data) for data in datasets.values()]
+
+
+def run(rows, data_dir, years, repeat):
+    """Time every stage on `rows` synthetic petitions; yields one result dict per stage."""
+    h1b_path, city_path = write_dataset(data_dir, rows)
+    os.chdir(data_dir)  # The pipeline's caches live next to the CSVs
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    def timed(stage, func, times=1):
+        best = float("inf")
+        for _ in range(times):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+        out = result[0] if isinstance(result, tuple) else result
+        return result, {"rows": rows, "stage": stage, "seconds": round(best, 4),
+                        "rows_out": len(out) if hasattr(out, "__len__") else None}
+
+    def chunks():
+        return iter_source(h1b_path, H1B_DTYPES)
+
+    results = []
+    _, result = timed("load_csv", lambda: sum(len(chunk) for chunk in chunks()))
+    results.append(dict(result, rows_out=rows))
+    raw, result = timed("load_cache", lambda: list(chunks()))
+    results.append(dict(result, rows_out=sum(len(chunk) for chunk in raw)))
+    moments, result = timed("zscore_moments", lambda: wage_moments(raw, OUTLIERS_BY))
+    results.append(result)
+    index = city_index(read_source(city_path, CITY_DTYPES))
+    merged, result = timed("merge", lambda: [prepare_chunk(chunk, index) for chunk in raw])
+    results.append(dict(result, rows_out=sum(len(chunk) for chunk in merged)))
+    kept, result = timed("zscore_filter", lambda: [drop_outliers(chunk, moments, OUTLIERS_BY)
+                                                   for chunk in merged])
+    results.append(dict(result, rows_out=sum(len(chunk) for chunk in kept)))
+    df, result = timed("concat_sort", lambda: concat_chunks(kept).sort_values(
+        "YEAR", kind="stable", ignore_index=True))
+    results.append(result)
+    del raw, merged, kept
+    cube, result = timed("cube", lambda: build_cube(df, SKETCH_ACCURACY))
+    results.append(dict(result, rows_out=len(cube.cells)))
+    for result in results:
+        yield result
+
+    _, result = timed("brush_rows", lambda: take_years(df, years), repeat)
+    yield result
+    _, result = timed("brush_cube", lambda: select_years(cube, years), repeat)
+    yield dict(result, rows_out=len(select_years(cube, years).cells))
+
+    version = cube_version(h1b_path, city_path, accuracy=cube.accuracy,
+                           outliers_by=OUTLIERS_BY)
+    for measure in [views.COUNT, views.WAGE]:
+        _, result = timed(f"panel:trend:{measure}",
+                          lambda: _cold(views.trend_data)(cube, df, version, measure), repeat)
+        yield result
+    for brush in [None, years]:
+        suffix = "" if brush is None else ":brushed"
+        for measure in [views.COUNT, views.WAGE]:
+            for category in ["JOB_TITLE", "EMPLOYER_NAME"]:
+                builders = {
+                    "bar": lambda: _cold(views.bar_data)(cube, version, measure, category, brush),
+                    "map": lambda: _cold(views.map_data)(cube, version, measure, brush,
+                                                         MAP_MAX_POINTS),
+                    "boxplot": lambda: _cold(views.boxplot_summary)(cube, version, measure,
+                                                                    category, brush),
+                    "scatter": lambda: _cold(views.scatter_data)(cube, df, version, category,
+                                                                 brush),
+                    "scatter_approx": lambda: _cold(views.scatter_data)(cube, df, version,
+                                                                        category, brush, True),
+                }
+                panels = {}
+                for name, builder in builders.items():
+                    panels[name], result = timed(f"panel:{name}:{measure}:{category}{suffix}",
+                                                 builder, repeat)
+                    yield result
+                specs = _chart_specs(measure, category, panels)
+                for name, (template, datasets) in specs.items():
+                    _, result = timed(f"spec:{name}:{measure}:{category}{suffix}",
+                                      lambda: _send(template, datasets), repeat)
+                    yield dict(result, rows_out=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "h1b-bench"),
+                        help="where the synthetic CSVs are kept, one folder per size")
+    parser.add_argument("--years", type=int, nargs="+", default=[2019, 2020, 2021],
+                        help="brush selection for the brushed stages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        data_dir = os.path.abspath(os.path.join(args.data_dir, str(rows)))
+        for result in run(rows, data_dir, args.years, args.repeat):
+            print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Deterministic synthetic h1b_data.csv and us_cities.csv for benchmarking the dashboard.
+
+The petitions follow the raw schema the dashboard reads (YEAR, STATE, CITY, JOB_TITLE,
+EMPLOYER_NAME, PREVAILING_WAGE) with the skew of the real data: Zipf-distributed cities,
+job titles and employers, more petitions in later years, lognormal wages that depend on the
+job title and year, some untrimmed names, a few extreme and missing wages, and cities that
+us_cities.csv doesn't list. The same rows, seed and chunk size always give the same files:
+
+    python benchmarks/synthetic.py --rows 10000000 --out /tmp/h1b-10m
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+STATES = [
+    "ALABAMA", "ALASKA", "ARIZONA", "ARKANSAS", "CALIFORNIA", "COLORADO", "CONNECTICUT",
+    "DELAWARE", "DISTRICT OF COLUMBIA", "FLORIDA", "GEORGIA", "HAWAII", "IDAHO", "ILLINOIS",
+    "INDIANA", "IOWA", "KANSAS", "KENTUCKY", "LOUISIANA", "MAINE", "MARYLAND", "MASSACHUSETTS",
+    "MICHIGAN", "MINNESOTA", "MISSISSIPPI", "MISSOURI", "MONTANA", "NEBRASKA", "NEVADA",
+    "NEW HAMPSHIRE", "NEW JERSEY", "NEW MEXICO", "NEW YORK", "NORTH CAROLINA", "NORTH DAKOTA",
+    "OHIO", "OKLAHOMA", "OREGON", "PENNSYLVANIA", "RHODE ISLAND", "SOUTH CAROLINA",
+    "SOUTH DAKOTA", "TENNESSEE", "TEXAS", "UTAH", "VERMONT", "VIRGINIA", "WASHINGTON",
+    "WEST VIRGINIA", "WISCONSIN", "WYOMING",
+]
+YEARS = np.arange(2012, 2024)
+CITIES = 5_000
+JOB_TITLES = 20_000
+EMPLOYERS = 200_000
+UNMATCHED_SHARE = 0.05  # of cities missing from us_cities.csv
+CHUNK_ROWS = 1_000_000
+
+
+def _cities(seed):
+    # State and coordinates of every city; a city's name is "CITY <i>"
+    rng = np.random.default_rng([seed, 0])
+    state = rng.integers(0, len(STATES), CITIES)
+    lat = (25 + 24 * rng.random(CITIES)).astype("float32")
+    lng = (-124 + 57 * rng.random(CITIES)).astype("float32")
+    return state, lat, lng
+
+
+def write_cities_csv(path, seed=0):
+    """us_cities.csv (city, state_name, lat, lng, population) in the dataset's casing."""
+    state, lat, lng = _cities(seed)
+    listed = np.random.default_rng([seed, 1]).random(CITIES) >= UNMATCHED_SHARE
+    pd.DataFrame({
+        "city": [f"City {i}" for i in np.flatnonzero(listed)],
+        "state_name": [STATES[s].title() for s in state[listed]],
+        "lat": lat[listed],
+        "lng": lng[listed],
+        "population": np.random.default_rng([seed, 2]).integers(1_000, 5_000_000, listed.sum()),
+    }).to_csv(path, index=False)
+
+
+def make_chunk(rows, seed=0, index=0):
+    """Raw petitions of chunk `index`: a DataFrame in h1b_data.csv's schema."""
+    rng = np.random.default_rng([seed, 3, index])
+    city_state, _, _ = _cities(seed)
+    city = (rng.zipf(1.3, rows) - 1) % CITIES
+    title = (rng.zipf(1.3, rows) - 1) % JOB_TITLES
+    year_weights = 1.15 ** np.arange(len(YEARS))
+    year = rng.choice(YEARS, rows, p=year_weights / year_weights.sum())
+
+    # Wages: a per-title level, 3% yearly growth and lognormal spread
+    title_level = np.random.default_rng([seed, 4]).normal(11.2, 0.25, JOB_TITLES)
+    wage = np.exp(title_level[title] + 0.03 * (year - YEARS[0]) + rng.normal(0, 0.3, rows))
+    extreme = rng.random(rows) < 1e-4
+    wage[extreme] = rng.uniform(1e6, 1e7, extreme.sum())
+    wage[rng.random(rows) < 1e-4] = np.nan
+
+    # About a tenth of the names come padded with whitespace, as in the real data
+    padded = rng.random(rows) < 0.1
+    return pd.DataFrame({
+        "YEAR": year,
+        "STATE": pd.Categorical.from_codes(city_state[city] + len(STATES) * padded,
+                                           STATES + [f" {s}" for s in STATES]),
+        "CITY": pd.Categorical.from_codes(city + CITIES * padded,
+                                          [f"CITY {i}" for i in range(CITIES)]
+                                          + [f"CITY {i} " for i in range(CITIES)]),
+        "JOB_TITLE": pd.Categorical.from_codes(title,
+                                               [f"JOB TITLE {i}" for i in range(JOB_TITLES)]),
+        "EMPLOYER_NAME": pd.Categorical.from_codes((rng.zipf(1.2, rows) - 1) % EMPLOYERS,
+                                                   [f"EMPLOYER {i} INC" for i in range(EMPLOYERS)]),
+        "PREVAILING_WAGE": wage.round(2),
+    })
+
+
+def write_h1b_csv(path, rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """h1b_data.csv with `rows` petitions, generated and written a chunk at a time."""
+    for index, start in enumerate(range(0, rows, chunk_rows)):
+        make_chunk(min(chunk_rows, rows - start), seed, index).to_csv(
+            path, mode="w" if index == 0 else "a", header=index == 0, index=False)
+
+
+def write_dataset(out_dir, rows, seed=0):
+    """Both CSVs in `out_dir`, unless they were generated there already; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    h1b_path = os.path.join(out_dir, "h1b_data.csv")
+    city_path = os.path.join(out_dir, "us_cities.csv")
+    marker = os.path.join(out_dir, f".synthetic-{rows}-{seed}")
+    if not os.path.exists(marker):
+        for name in os.listdir(out_dir):
+            if name.startswith(".synthetic-"):
+                os.remove(os.path.join(out_dir, name))  # The CSVs are about to change
+        write_cities_csv(city_path, seed)
+        write_h1b_csv(h1b_path, rows, seed)
+        open(marker, "w").close()
+    return h1b_path, city_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args()
+    write_dataset(args.out, args.rows, args.seed)
@@ -1,8 +1,8 @@
 import streamlit as st
-import pandas as pd
 import altair as alt
-import numpy as np
-from scipy import stats
+
+from h1b.data import load_prepared_data
+from h1b.topo import us_map_url
 
 st.set_page_config(page_title="Breakdown of H1B Visa Analysis Dashboard", layout="wide")
 
@@ -14,44 +14,18 @@ with st.sidebar:
     st.markdown("[Geographical Analysis](#d9365024)")
     st.markdown("[Correlation Analysis](#b206fc94)")
 
-# Load H1B dataset
-@st.cache_data
-def load_h1b_data():
-    return pd.read_csv("h1b_data.csv")  # Ensure this file is available
-
-df = load_h1b_data()
-
-# Load city dataset (for latitude & longitude)
-@st.cache_data
-def load_city_data():
-    return pd.read_csv("us_cities.csv")  # Ensure this file is available
+# Load the prepared H1B dataset (cleaned, joined with city coordinates, outliers removed).
+# Cached once per version of the source CSVs and shared read-only across reruns and sessions.
+df = load_prepared_data()  # Ensure h1b_data.csv and us_cities.csv are available
 
-# Load TopoJSON for the US Map
+# Load TopoJSON for the US Map (served from static/, see `python -m h1b.topo`)
 @st.cache_data
 def load_us_map():
-    return alt.topo_feature("https://cdn.jsdelivr.net/npm/us-atlas@3/states-10m.json", "states")
+    return alt.topo_feature(us_map_url(simplified=True), "states")
 
 
 us_map = load_us_map()
 
-city_df = load_city_data()
-
-# Merge H1B data with city coordinates
-df["STATE"] = df["STATE"].str.strip()
-df["CITY"] = df["CITY"].str.strip()
-
-city_df["city"] = city_df["city"].str.strip().str.upper()
-city_df["state_name"] = city_df["state_name"].str.strip().str.upper()
-
-df = df.merge(city_df[['city', 'state_name', 'lat', 'lng']],
-              left_on=['CITY', 'STATE'],
-              right_on=['city', 'state_name'],
-              how='left')
-
-# Outlier removal
-z = np.abs(stats.zscore(df['PREVAILING_WAGE']))
-df = df[(z < 3)]
-
 # Configure layout
 st.title("📊 Breakdown of H1B Visa Analysis Dashboard")
 
@@ -151,10 +125,10 @@ selected_category = st.selectbox("Select Dimension:", list(
 
 # Aggregate data
 if selected_measure == "Number of Petitions":
-    bar_data = df.groupby(category_options[selected_category]).size(
+    bar_data = df.groupby(category_options[selected_category], observed=True).size(
     ).reset_index(name="Count of Petitions")
 else:
-    bar_data = df.groupby(category_options[selected_category])[
+    bar_data = df.groupby(category_options[selected_category], observed=True)[
         "PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
 
 bar_data = bar_data.nlargest(
@@ -184,10 +158,10 @@ selected_category = st.selectbox("Select Dimension:", list(
 
 # Aggregate data
 if selected_measure == "Number of Petitions":
-    bar_data = df.groupby(category_options[selected_category]).size(
+    bar_data = df.groupby(category_options[selected_category], observed=True).size(
     ).reset_index(name="Count of Petitions")
 else:
-    bar_data = df.groupby(category_options[selected_category])[
+    bar_data = df.groupby(category_options[selected_category], observed=True)[
         "PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
 
 bar_data = bar_data.nlargest(
@@ -220,9 +194,9 @@ print(chart_type)
 if chart_type == "Map":
     # Aggregate data for cities
     if selected_measure == "Number of Petitions":
-        map_data = df.groupby(["CITY", "STATE", "lat", "lng"]).size().reset_index(name="Count of Petitions")
+        map_data = df.groupby(["CITY", "STATE", "lat", "lng"], observed=True).size().reset_index(name="Count of Petitions")
     else:
-        map_data = df.groupby(["CITY", "STATE", "lat", "lng"])["PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
+        map_data = df.groupby(["CITY", "STATE", "lat", "lng"], observed=True)["PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
 
     # Background US Map (TopoJSON)
     background = alt.Chart(us_map).mark_geoshape(
@@ -247,10 +221,10 @@ if chart_type == "Map":
 elif chart_type == "Boxplot":  # Make sure to use elif for clarity
     # Aggregate data by the state and the selected category (job title or employer name)
     if selected_measure == "Number of Petitions":
-        boxplot_data = df.groupby(["STATE", category_options[selected_category]]).size(
+        boxplot_data = df.groupby(["STATE", category_options[selected_category]], observed=True).size(
         ).reset_index(name="Count of Petitions")
     else:
-        boxplot_data = df.groupby(["STATE", category_options[selected_category]])[
+        boxplot_data = df.groupby(["STATE", category_options[selected_category]], observed=True)[
             "PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
         
     # Boxplot
@@ -270,9 +244,9 @@ print(chart_type)
 if chart_type == "Map":
     # Aggregate data for cities
     if selected_measure == "Number of Petitions":
-        map_data = df.groupby(["CITY", "STATE", "lat", "lng"]).size().reset_index(name="Count of Petitions")
+        map_data = df.groupby(["CITY", "STATE", "lat", "lng"], observed=True).size().reset_index(name="Count of Petitions")
     else:
-        map_data = df.groupby(["CITY", "STATE", "lat", "lng"])["PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
+        map_data = df.groupby(["CITY", "STATE", "lat", "lng"], observed=True)["PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
 
     # Background US Map (TopoJSON)
     background = alt.Chart(us_map).mark_geoshape(
@@ -297,10 +271,10 @@ if chart_type == "Map":
 elif chart_type == "Boxplot":  # Make sure to use elif for clarity
     # Aggregate data by the state and the selected category (job title or employer name)
     if selected_measure == "Number of Petitions":
-        boxplot_data = df.groupby(["STATE", category_options[selected_category]]).size(
+        boxplot_data = df.groupby(["STATE", category_options[selected_category]], observed=True).size(
         ).reset_index(name="Count of Petitions")
     else:
-        boxplot_data = df.groupby(["STATE", category_options[selected_category]])[
+        boxplot_data = df.groupby(["STATE", category_options[selected_category]], observed=True)[
             "PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
         
     # Boxplot
@@ -320,7 +294,7 @@ Here is the code for the third part of the bottom section:
 ```python
 st.subheader("🔄 Correlation Analysis")
 
-scatter_data = df.groupby(category_options[selected_category]).agg(
+scatter_data = df.groupby(category_options[selected_category], observed=True).agg(
     **{"Count of Petitions": (category_options[selected_category], "count"),  # Count of rows**
     "Prevailing Wage": ("PREVAILING_WAGE", "median")}  # Median Salary
 ).reset_index()
@@ -345,7 +319,7 @@ Here is the output of the third part of the bottom section:
 
 
 st.divider()
-scatter_data = df.groupby(category_options[selected_category]).agg(
+scatter_data = df.groupby(category_options[selected_category], observed=True).agg(
     **{"Count of Petitions": (category_options[selected_category], "count"),  # Count of rows**
     "Prevailing Wage": ("PREVAILING_WAGE", "median")}  # Median Salary
 ).reset_index()
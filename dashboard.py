@@ -1,49 +1,74 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
-import numpy as np
-from scipy import stats
-
-st.set_page_config(page_title="H1B Visa Analysis Dashboard", layout="wide")
+import contextlib
+import os
 
-# Load H1B dataset
-@st.cache_data
-def load_h1b_data():
-    return pd.read_csv("h1b_data.csv")  # Ensure this file is available
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-df = load_h1b_data()
+from h1b import charts, instrument, transport, views
+from h1b.data import cube_version, load_cube, load_prepared_data
+from h1b.settings import BOXPLOT_SERVER_STATS, MAP_MAX_POINTS, OUTLIERS_BY, SKETCH_ACCURACY
+from h1b.topo import us_map_url
 
-# Load city dataset (for latitude & longitude)
-@st.cache_data
-def load_city_data():
-    return pd.read_csv("us_cities.csv")  # Ensure this file is available
+st.set_page_config(page_title="H1B Visa Analysis Dashboard", layout="wide")
 
-# Load TopoJSON for the US Map
+# Outlier cut, sketch accuracy, map size and boxplot engine: see h1b/settings.py
+# Send chart data compacted (labels without unused categories, float32 coordinates,
+# narrow integers); the instrumentation panel compares payload sizes with and without it
+COMPACT_CHART_DATA = True
+# Opt-in instrumentation (H1B_INSTRUMENT=1): per-stage wall time, rows, memory and cache use,
+# shown in the sidebar and logged; H1B_METRICS_FILE also writes Prometheus counters there
+INSTRUMENT = bool(os.environ.get("H1B_INSTRUMENT"))
+recorder = instrument.start() if INSTRUMENT else None
+
+
+def chart_data(data):
+    # View data in the form the charts send it to the browser
+    return transport.compact(data) if COMPACT_CHART_DATA else data
+
+
+# Load the prepared H1B dataset (cleaned, joined with city coordinates, outliers removed
+# within each year).
+# Cached once per version of the source CSVs and shared read-only across reruns and sessions.
+# Ensure h1b_data.csv and us_cities.csv are available; the version of the data and the cube's
+# settings keys the panels' view data caches
+version = cube_version(accuracy=SKETCH_ACCURACY, outliers_by=OUTLIERS_BY)
+with instrument.stage("load dataset") as stage:
+    df = load_prepared_data(outliers_by=OUTLIERS_BY)
+    stage.rows_out = len(df)
+
+# Pre-aggregated cube of the same data: counts and wage totals per
+# YEAR x STATE x CITY x JOB_TITLE x EMPLOYER_NAME cell, which the panels roll up from
+with instrument.stage("load cube") as stage:
+    cube = load_cube(accuracy=SKETCH_ACCURACY, outliers_by=OUTLIERS_BY)
+    stage.rows_out = len(cube.cells)
+
+# Median engine: exact medians scan the matching petition rows, approximate medians are
+# merged from the cube's wage sketches per year, job title and employer, so their cost
+# doesn't grow with the row count
+with st.sidebar:
+    approximate_medians = st.toggle(
+        "Approximate medians", value=False,
+        help=f"Compute salary medians from quantile sketches (within {SKETCH_ACCURACY:.0%}) "
+             "instead of scanning every petition. On millions of petitions the trend's medians "
+             "come about 10x faster, the scatter plot's about 1.5x; on small datasets it "
+             "makes little difference.")
+    # Crossfilter mode: the browser applies the year brush to the panels itself, from
+    # per-YEAR totals sent once, so brushing doesn't rerun the script
+    brush_in_browser = st.toggle(
+        "Brush in the browser", value=False,
+        help="Filter the panels by the year brush in the browser, without a round trip to "
+             "the server. Salaries are averaged, including in the correlation plot, and the "
+             "boxplot shows all years.")
+
+# TopoJSON for the US Map, served by the app from static/ once fetched with
+# `python -m h1b.topo` (the simplified variant is plenty for a one-third-width panel)
 @st.cache_data
 def load_us_map():
-    return alt.topo_feature("https://cdn.jsdelivr.net/npm/us-atlas@3/states-10m.json", "states")
+    return us_map_url(simplified=True)
 
 
 us_map = load_us_map()
 
-city_df = load_city_data()
-
-# Merge H1B data with city coordinates
-df["STATE"] = df["STATE"].str.strip()
-df["CITY"] = df["CITY"].str.strip()
-
-city_df["city"] = city_df["city"].str.strip().str.upper()
-city_df["state_name"] = city_df["state_name"].str.strip().str.upper()
-
-df = df.merge(city_df[['city', 'state_name', 'lat', 'lng']],
-              left_on=['CITY', 'STATE'],
-              right_on=['city', 'state_name'],
-              how='left')
-
-# Outlier removal
-z = np.abs(stats.zscore(df['PREVAILING_WAGE']))
-df = df[(z < 3)]
-
 # Configure layout
 st.title("📊 H1B Visa Analysis Dashboard")
 
@@ -56,37 +81,33 @@ measure_options = {"Number of Petitions": "Count of Petitions",
 selected_measure = st.selectbox(
     "Select Measure:", list(measure_options.keys()))
 
-# Aggregate data for line chart
-if selected_measure == "Number of Petitions":
-    trend_data = df.groupby("YEAR").size().reset_index(
-        name="Count of Petitions")
-else:
-    trend_data = df.groupby("YEAR")["PREVAILING_WAGE"].median(
-    ).reset_index(name="Prevailing Wage")
-
-# Line Chart
-brush = alt.selection_interval(name="brush", encodings=['x']) # Brush for selection
-
-line_chart = alt.Chart(trend_data).mark_line(point=True).encode(
-    x="YEAR:O",
-    y=measure_options[selected_measure],
-    tooltip=["YEAR", measure_options[selected_measure]]
-).add_params(brush) # Add brush to chart
-
-# Grab selection
-selection = st.altair_chart(line_chart, use_container_width=True, on_select='rerun')
-
-# Filter based on selection e.g., [2021, 2022, 2023]
-if 'YEAR' in selection['selection']['brush']:
-    years = selection['selection']['brush']['YEAR']
-    df = df[df['YEAR'].isin(years)]
+# Aggregate data for line chart (each panel's view data is memoized on its inputs)
+with instrument.stage("panel:trend", cached=True) as stage:
+    trend_data = views.trend_data(cube, df, version, measure_options[selected_measure],
+                                  approximate_medians)
+    stage.rows_out = len(trend_data)
+
+# Line Chart, with a brush for selection (charts are spec templates built once per
+# measure/category/view and filled with the rerun's data, see h1b.charts)
+line_chart = charts.with_data(charts.trend(measure_options[selected_measure]),
+                              trend=chart_data(trend_data))
+
+# Filter based on selection e.g., [2021, 2022, 2023]; the panels below apply it (in
+# crossfilter mode, the line chart is drawn with the panels and the browser applies it)
+years = None
+if not brush_in_browser:
+    # Grab selection
+    with instrument.stage("render:trend"):
+        selection = st.vega_lite_chart(line_chart, use_container_width=True,
+                                       on_select='rerun')
+    if 'YEAR' in selection['selection']['brush']:
+        years = tuple(sorted(selection['selection']['brush']['YEAR']))
 
 st.divider()
 
 # **Bottom Section: Three Columns ************************************************
 col1, col2, col3 = st.columns([1, 1, 1])
 
-# **First Column: Job Title / Employer Name**
 with col1:
     st.subheader("📌 Breakdown by Job Title / Employer")
 
@@ -96,96 +117,205 @@ with col1:
     selected_category = st.selectbox("Select Dimension:", list(
         category_options.keys()), key="category")
 
-    # Aggregate data
-    if selected_measure == "Number of Petitions":
-        bar_data = df.groupby(category_options[selected_category]).size(
-        ).reset_index(name="Count of Petitions")
-    else:
-        bar_data = df.groupby(category_options[selected_category])[
-            "PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
-
-    bar_data = bar_data.nlargest(
-        20, measure_options[selected_measure])  # Select Top 10
-
-    # Bar Chart
-    bar_chart = alt.Chart(bar_data).mark_bar().encode(
-        x=measure_options[selected_measure],
-        y=alt.X(category_options[selected_category] +
-                ":O", sort="-x"),  # Ensures descending order
-        tooltip=[category_options[selected_category],
-                 measure_options[selected_measure]]
-    ).properties(height=alt.Step(20))
 
-    st.altair_chart(bar_chart, use_container_width=True)
-
-# **Second Column: Map / Boxplot**
-with col2:
+def choose_view():
     st.subheader("🌍 Geographical Analysis")
 
     # Radio button to select Map or Boxplot
     chart_type = st.radio("Choose View:", ["Map", "Boxplot"], key="map_or_boxplot")
     print(chart_type)
-    if chart_type == "Map":
-        # Aggregate data for cities
-        if selected_measure == "Number of Petitions":
-            map_data = df.groupby(["CITY", "STATE", "lat", "lng"]).size().reset_index(name="Count of Petitions")
-        else:
-            map_data = df.groupby(["CITY", "STATE", "lat", "lng"])["PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
-
-        # Background US Map (TopoJSON)
-        background = alt.Chart(us_map).mark_geoshape(
-            fill="whitesmoke",
-            stroke="white"
-        ).project(
-            type="albersUsa"
-        )
-        # Overlay: Altair Map of cities
-        city_layer = alt.Chart(map_data).mark_circle().encode(
-            longitude="lng:Q",
-            latitude="lat:Q",
-            size=alt.Size(measure_options[selected_measure]+":Q", scale=alt.Scale(range=[10, 500])),
-            color=alt.Color(measure_options[selected_measure]+":Q", scale=alt.Scale(scheme="reds")),
-            tooltip=["CITY", "STATE", measure_options[selected_measure]]
-        )
-
-        # Combine Background + City Layer
-        map_chart = background + city_layer
-        st.altair_chart(map_chart, use_container_width=True)
+    return chart_type
 
-    elif chart_type == "Boxplot":  # Make sure to use elif for clarity
-        if selected_measure == "Number of Petitions":
-            boxplot_data = df.groupby(["STATE", category_options[selected_category]]).size(
-            ).reset_index(name="Count of Petitions")
-        else:
-            boxplot_data = df.groupby(["STATE", category_options[selected_category]])[
-                "PREVAILING_WAGE"].mean().reset_index(name="Prevailing Wage")
-            
-        # Boxplot
-        boxplot = alt.Chart(boxplot_data).mark_boxplot().encode(
-            y="STATE:N",
-            x=measure_options[selected_measure]+":Q"
-        )
-        st.altair_chart(boxplot, use_container_width=True)
-
-# **Third Column: Scatter Plot**
-with col3:
+
+def choose_second_measure():
     st.subheader("🔄 Correlation Analysis")
 
-    scatter_data = df.groupby(category_options[selected_category]).agg(
-       **{"Count of Petitions": (category_options[selected_category], "count"),  # Count of rows**
-       "Prevailing Wage": ("PREVAILING_WAGE", "median")}  # Median Salary
-    ).reset_index()
-    
     # Dropdown for second measure
-    second_measure = st.selectbox("Select Second Measure:", list(
+    return st.selectbox("Select Second Measure:", list(
         measure_options.keys()), key="scatter_measure")
 
-    # Scatter Plot
-    scatter_chart = alt.Chart(scatter_data).mark_circle(size=60).encode(
-        x=measure_options[selected_measure]+":Q",
-        y=measure_options[second_measure]+":Q",
-        color=alt.Color(measure_options[selected_measure]+":Q",scale=alt.Scale(scheme="blues")),
-        tooltip=[category_options[selected_category], measure_options[selected_measure], measure_options[second_measure]]
-    ).properties(height=350)
 
-    st.altair_chart(scatter_chart, use_container_width=True)
+def top_cities(cities):
+    # The unmatched cities with the most petitions, e.g. to add to us_cities.csv
+    names = "; ".join(f"{city}, {state} ({petitions:,})"
+                      for city, state, petitions in cities.itertuples(index=False))
+    return f" Most are in {names}." if names else ""
+
+
+def draw_boxplot(measure, boxplot_data):
+    caption = None
+    if BOXPLOT_SERVER_STATS:
+        box_stats, box_outliers = boxplot_data
+
+        # Boxplot drawn from the precomputed statistics: whiskers, box, median, outliers
+        boxplot = charts.with_data(charts.boxplot_summary(measure),
+                                   stats=box_stats, outliers=box_outliers)
+        # The outliers sent are capped per state (see views.MAX_OUTLIERS)
+        outliers = int(box_stats["outliers"].sum())
+        if outliers > len(box_outliers):
+            caption = (f"Only the {views.MAX_OUTLIERS} outliers farthest from the median are "
+                       f"drawn per state ({len(box_outliers):,} of {outliers:,}).")
+    else:
+        # Boxplot
+        boxplot = charts.with_data(charts.boxplot(measure), values=boxplot_data)
+    with instrument.stage("render:boxplot"):
+        st.vega_lite_chart(boxplot, use_container_width=True)
+    if caption:
+        st.caption(caption)
+
+
+@contextlib.contextmanager
+def fragment_stages():
+    # A fragment rerun runs only the fragment: record its stages apart from the last full
+    # run's, whose recorder has been shown already. They are logged and counted, but the
+    # sidebar panel (which a fragment can't write to) keeps showing the last full run
+    ctx = get_script_run_ctx()
+    if not (INSTRUMENT and ctx is not None and ctx.fragment_ids_this_run):
+        yield
+        return
+    rerun = instrument.start()
+    try:
+        yield
+    finally:
+        rerun.finish(os.environ.get("H1B_METRICS_FILE"))
+
+
+# The Map/Boxplot and scatter panels are fragments: changing their own widget reruns just
+# that panel, with the arguments of the last full run (everything else they depend on)
+@st.fragment
+def geo_panel(measure, category, years, prefetched):
+    with fragment_stages():
+        draw_geo_panel(measure, category, years, prefetched)
+
+
+def draw_geo_panel(measure, category, years, prefetched):
+    chart_type = choose_view()
+    panels = prefetched.get(chart_type)
+    if panels is None:  # The view was switched since the last full run
+        panels = chart_data(views.gather(**views.panel_tasks(
+            cube, df, version, measure, category, chart_type, years, approximate_medians,
+            MAP_MAX_POINTS, BOXPLOT_SERVER_STATS, panels=["geo"])))
+
+    if chart_type == "Map":
+        map_data, map_level = panels["map"]
+
+        # Background US Map (TopoJSON) + overlay of cities
+        map_chart = charts.with_data(charts.city_map(measure, us_map), map=map_data)
+        with instrument.stage("render:map"):
+            st.vega_lite_chart(map_chart, use_container_width=True)
+
+        if map_level:
+            st.caption(f"Cities are grouped into {len(map_data)} {map_level} bins "
+                       "to keep the map responsive.")
+
+        # Geocoding coverage: petitions in cities missing from us_cities.csv aren't plotted
+        unmatched = panels["unmatched"]
+        if unmatched:
+            st.caption(f"{unmatched:.1%} of petitions are in cities without known coordinates "
+                       "and are not shown on the map." + top_cities(panels["unmatched_cities"]))
+
+    elif chart_type == "Boxplot":  # Make sure to use elif for clarity
+        draw_boxplot(measure, panels["boxplot"])
+
+
+@st.fragment
+def scatter_panel(measure, category, scatter_data):
+    with fragment_stages():
+        draw_scatter_panel(measure, category, scatter_data)
+
+
+def draw_scatter_panel(measure, category, scatter_data):
+    second_measure = choose_second_measure()
+
+    # Scatter Plot (its data has both measures, so the second one only changes the spec)
+    scatter_chart = charts.with_data(
+        charts.scatter(measure, measure_options[second_measure], category),
+        scatter=scatter_data)
+
+    with instrument.stage("render:scatter"):
+        st.vega_lite_chart(scatter_chart, use_container_width=True)
+
+
+if brush_in_browser:
+    # Every widget changes the one chart below, so they all rerun the whole script
+    with col2:
+        chart_type = choose_view()
+    with col3:
+        second_measure = choose_second_measure()
+
+    # Per-YEAR totals for the panels, which the browser sums over the brushed YEARs
+    view_data = views.gather(**views.crossfilter_tasks(
+        cube, version, measure_options[selected_measure], category_options[selected_category],
+        chart_type, MAP_MAX_POINTS, BOXPLOT_SERVER_STATS))
+    panels = chart_data(view_data)
+    datasets = {"trend": chart_data(trend_data), "categories": panels["categories"]}
+    if chart_type == "Map":
+        datasets["cities"], map_level = panels["map"]
+    else:
+        # The boxplot is drawn by itself, from every petition's wage: the brush can't filter it
+        with col2:
+            draw_boxplot(measure_options[selected_measure], panels["boxplot"])
+            st.caption("The boxplot covers all years; the brush below doesn't filter it.")
+
+    # Line chart and the brushed panels in one chart, linked by the brush
+    crossfilter_chart = charts.with_data(charts.crossfilter(
+        measure_options[selected_measure], measure_options[second_measure],
+        category_options[selected_category], chart_type, us_map), **datasets)
+    with instrument.stage("render:crossfilter"):
+        st.vega_lite_chart(crossfilter_chart, use_container_width=False)
+
+    if chart_type == "Map":
+        if map_level:
+            st.caption(f"Cities are grouped into {map_level} bins to keep the map responsive.")
+        unmatched = panels["unmatched"]
+        if unmatched:
+            st.caption(f"{unmatched:.1%} of petitions (over all years) are in cities without "
+                       "known coordinates and are not shown on the map."
+                       + top_cities(panels["unmatched_cities"]))
+else:
+    # Aggregate the panels' data concurrently, one core each, including the geo panel's for
+    # its current view (the radio's value from the previous run, before it is drawn)
+    chart_type = st.session_state.get("map_or_boxplot", "Map")
+    view_data = views.gather(**views.panel_tasks(
+        cube, df, version, measure_options[selected_measure],
+        category_options[selected_category], chart_type, years, approximate_medians,
+        MAP_MAX_POINTS, BOXPLOT_SERVER_STATS))
+    panels = chart_data(view_data)
+
+    # **First Column: Job Title / Employer Name**
+    with col1:
+        bar_data = panels["bar"]
+
+        # Bar Chart, in descending order
+        bar_chart = charts.with_data(
+            charts.bar(measure_options[selected_measure], category_options[selected_category]),
+            bar=bar_data)
+
+        with instrument.stage("render:bar"):
+            st.vega_lite_chart(bar_chart, use_container_width=True)
+
+    # **Second Column: Map / Boxplot**
+    with col2:
+        geo_panel(measure_options[selected_measure], category_options[selected_category],
+                  years, {chart_type: panels})
+
+    # **Third Column: Scatter Plot**
+    with col3:
+        scatter_panel(measure_options[selected_measure], category_options[selected_category],
+                      panels["scatter"])
+
+# Instrumentation of this rerun: the server-side stages (the browser's own rendering time
+# isn't measured here)
+if recorder is not None:
+    recorder.finish(os.environ.get("H1B_METRICS_FILE"))
+    with st.sidebar.expander("Instrumentation"):
+        stages = recorder.frame()
+        st.caption(f"{recorder.seconds() * 1000:.0f} ms across {len(stages)} stages "
+                   "(nested stages are part of their parent's time)")
+        st.dataframe(stages, hide_index=True)
+        # Chart data payloads: JSON records vs. Arrow as sent today vs. compacted Arrow
+        payloads = transport.report(trend=trend_data, **view_data)
+        st.caption(f"Chart data: {payloads['json_bytes'].sum() / 1024:.0f} KB as JSON, "
+                   f"{payloads['arrow_bytes'].sum() / 1024:.0f} KB as Arrow, "
+                   f"{payloads['compact_bytes'].sum() / 1024:.0f} KB compacted")
+        st.dataframe(payloads, hide_index=True)
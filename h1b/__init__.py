@@ -0,0 +1 @@
+"""Data pipeline behind the H1B Visa Analysis Dashboard (`dashboard.py`)."""
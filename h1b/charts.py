@@ -0,0 +1,204 @@
+"""Vega-Lite spec templates for the dashboard's charts, built once and reused with new data.
+
+Building an Altair chart validates it against the Vega-Lite schema, and `to_dict` does it
+again; `st.altair_chart` pays for both on every rerun, and hashes the chart's data on top.
+The templates here are Altair charts over named datasets (`alt.NamedData`), converted to
+Vega-Lite dicts once per combination of their arguments and cached for the process.
+`with_data` fills in a template's datasets by name, ready for `st.vega_lite_chart`, so a
+rerun only converts its view data to Arrow.
+
+Templates are shared by every session: treat them as read-only.
+"""
+import functools
+
+import altair as alt
+
+from h1b.views import COUNT, WAGE
+
+# Panel widths in the crossfilter chart: a composed chart can't size its parts to the page
+PANEL_WIDTH = 300
+PANEL_SPACING = 40
+
+
+def _spec(chart):
+    # As `st.altair_chart` converts charts: without Altair's default theme, whose
+    # width/height defaults don't suit Streamlit's layout
+    with alt.theme.enable("none"):
+        return chart.to_dict()
+
+
+def with_data(template, **datasets):
+    """The template's spec with its named datasets set to the given frames."""
+    return dict(template, datasets=datasets)
+
+
+@functools.cache
+def trend(measure):
+    """Line chart of `measure` by YEAR, with an x interval selection named "brush".
+
+    Dataset: "trend".
+    """
+    brush = alt.selection_interval(name="brush", encodings=["x"])
+    return _spec(alt.Chart(alt.NamedData("trend")).mark_line(point=True).encode(
+        x="YEAR:O",
+        y=measure + ":Q",
+        tooltip=["YEAR:Q", measure + ":Q"]
+    ).add_params(brush))
+
+
+@functools.cache
+def bar(measure, category):
+    """Bar chart of `measure` by `category`, in descending order. Dataset: "bar"."""
+    return _spec(alt.Chart(alt.NamedData("bar")).mark_bar().encode(
+        x=measure + ":Q",
+        y=alt.X(category + ":O", sort="-x"),
+        tooltip=[category + ":N", measure + ":Q"]
+    ).properties(height=alt.Step(20)))
+
+
+@functools.cache
+def city_map(measure, map_url):
+    """Cities sized and colored by `measure` over the US states TopoJSON at `map_url`.
+
+    Dataset: "map".
+    """
+    background = alt.Chart(alt.topo_feature(map_url, "states")).mark_geoshape(
+        fill="whitesmoke",
+        stroke="white"
+    ).project(
+        type="albersUsa"
+    )
+    city_layer = alt.Chart(alt.NamedData("map")).mark_circle().encode(
+        longitude="lng:Q",
+        latitude="lat:Q",
+        size=alt.Size(measure + ":Q", scale=alt.Scale(range=[10, 500])),
+        color=alt.Color(measure + ":Q", scale=alt.Scale(scheme="reds")),
+        tooltip=["CITY:N", "STATE:N", measure + ":Q"]
+    )
+    return _spec(background + city_layer)
+
+
+@functools.cache
+def boxplot_summary(measure):
+    """Boxplots of `measure` by STATE drawn from precomputed statistics.
+
+    Datasets: "stats" (`h1b.stats.boxplot_stats` columns) and "outliers".
+    """
+    box_base = alt.Chart(alt.NamedData("stats")).encode(
+        y="STATE:N",
+        tooltip=["STATE:N", "lower:Q", "q1:Q", "median:Q", "q3:Q", "upper:Q", "count:Q",
+                 "outliers:Q"]
+    )
+    whiskers = box_base.mark_rule().encode(
+        x=alt.X("lower:Q", title=measure),
+        x2="upper:Q"
+    )
+    box = box_base.mark_bar(size=14).encode(x="q1:Q", x2="q3:Q")
+    median_tick = box_base.mark_tick(color="white", size=14).encode(x="median:Q")
+    outlier_points = alt.Chart(alt.NamedData("outliers")).mark_point(size=10).encode(
+        y="STATE:N",
+        x=measure + ":Q"
+    )
+    return _spec(whiskers + box + median_tick + outlier_points)
+
+
+@functools.cache
+def boxplot(measure):
+    """Boxplots of `measure` by STATE computed by Vega-Lite. Dataset: "values"."""
+    return _spec(alt.Chart(alt.NamedData("values")).mark_boxplot().encode(
+        y="STATE:N",
+        x=measure + ":Q"
+    ))
+
+
+@functools.cache
+def scatter(measure, second_measure, category):
+    """Scatter plot of `measure` against `second_measure`, one point per `category` value.
+
+    Dataset: "scatter".
+    """
+    return _spec(alt.Chart(alt.NamedData("scatter")).mark_circle(size=60).encode(
+        x=measure + ":Q",
+        y=second_measure + ":Q",
+        color=alt.Color(measure + ":Q", scale=alt.Scale(scheme="blues")),
+        tooltip=[category + ":N", measure + ":Q", second_measure + ":Q"]
+    ).properties(height=350))
+
+
+def _measures(measure, second_measure):
+    # The measures from summed totals: petitions counted, wages averaged
+    formulas = {COUNT: "datum.count", WAGE: "datum.wage_sum / datum.count"}
+    return {name: formulas[name] for name in dict.fromkeys([measure, second_measure])}
+
+
+def _brushed_totals(data, brush, groupby, measures):
+    # Totals of the brushed YEARs per group, with the measures computed from them
+    return alt.Chart(alt.NamedData(data)).transform_filter(brush).transform_aggregate(
+        count="sum(count)", wage_sum="sum(wage_sum)", groupby=groupby
+    ).transform_calculate(**measures)
+
+
+@functools.cache
+def crossfilter(measure, second_measure, category, chart_type, map_url, k=20):
+    """All charts in one Vega-Lite view, where the trend's brush filters the panels below.
+
+    Each panel sums the per-YEAR totals of its dataset over the brushed YEARs and computes
+    its measures from them, in the browser, so brushing needs no rerun. Wages are averaged,
+    including in the scatter plot (medians can't be merged from totals). The map sits
+    between the bar chart and the scatter plot; for `chart_type` "Boxplot" it is left out,
+    as a boxplot can't be computed from totals. Datasets: "trend" (as for `trend`),
+    "categories" (YEAR x `category` count and wage_sum) and, for the map, "cities" (YEAR x
+    CITY, STATE, lat, lng).
+    """
+    brush = alt.selection_interval(name="brush", encodings=["x"])
+    measures = _measures(measure, second_measure)
+
+    # Top `k` job titles or employers by the measure
+    bar_chart = _brushed_totals("categories", brush, [category], measures).transform_window(
+        rank="row_number()", sort=[alt.SortField(measure, order="descending")]
+    ).transform_filter(alt.datum.rank <= k).mark_bar().encode(
+        x=measure + ":Q",
+        y=alt.X(category + ":O", sort="-x"),
+        tooltip=[category + ":N", measure + ":Q"]
+    ).properties(width=PANEL_WIDTH, height=alt.Step(20))
+
+    if chart_type == "Map":
+        background = alt.Chart(alt.topo_feature(map_url, "states")).mark_geoshape(
+            fill="whitesmoke",
+            stroke="white"
+        ).project(
+            type="albersUsa"
+        )
+        city_layer = _brushed_totals("cities", brush, ["CITY", "STATE", "lat", "lng"],
+                                     measures).mark_circle().encode(
+            longitude="lng:Q",
+            latitude="lat:Q",
+            size=alt.Size(measure + ":Q", scale=alt.Scale(range=[10, 500])),
+            color=alt.Color(measure + ":Q", scale=alt.Scale(scheme="reds")),
+            tooltip=["CITY:N", "STATE:N", measure + ":Q"]
+        )
+        panels = [bar_chart, (background + city_layer).properties(width=PANEL_WIDTH)]
+    else:
+        panels = [bar_chart]
+
+    scatter_chart = _brushed_totals("categories", brush, [category],
+                                    measures).mark_circle(size=60).encode(
+        x=measure + ":Q",
+        y=second_measure + ":Q",
+        color=alt.Color(measure + ":Q", scale=alt.Scale(scheme="blues")),
+        tooltip=[category + ":N", measure + ":Q", second_measure + ":Q"]
+    ).properties(width=PANEL_WIDTH, height=350)
+    panels.append(scatter_chart)
+
+    # The line chart spans the panels below it
+    trend_chart = alt.Chart(alt.NamedData("trend")).mark_line(point=True).encode(
+        x="YEAR:O",
+        y=measure + ":Q",
+        tooltip=["YEAR:Q", measure + ":Q"]
+    ).add_params(brush).properties(
+        width=len(panels) * PANEL_WIDTH + (len(panels) - 1) * PANEL_SPACING)
+
+    return _spec(alt.vconcat(
+        trend_chart,
+        alt.hconcat(*panels, spacing=PANEL_SPACING)
+    ).resolve_scale(color="independent", size="independent"))
@@ -0,0 +1,167 @@
+"""Pre-aggregated cube of the prepared dataset, which the dashboard panels roll up from.
+
+The cube has one cell per distinct YEAR x STATE x CITY x JOB_TITLE x EMPLOYER_NAME
+combination holding the petition count and wage total, plus a wage quantile sketch per cell
+(see `h1b.sketch`). Every rollup the dashboard needs is a groupby over the cells, so its cost
+grows with the number of groups rather than the number of petitions.
+
+Merging the sketches of hundreds of thousands of cells costs more than an exact median over
+the rows, so the cube also keeps the sketches merged at the coarser grains the median views
+query (`QUANTILE_GRAINS`), and quantile rollups start from the smallest one that covers them.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from h1b.parallel import map_reduce
+from h1b.partition import take_spans, take_years, year_spans
+from h1b.sketch import DEFAULT_ACCURACY, build_sketches, merge_sketches, sketch_quantile
+
+DIMENSIONS = ["YEAR", "STATE", "CITY", "JOB_TITLE", "EMPLOYER_NAME"]
+# City coordinates depend only on CITY/STATE, so they ride along as cell attributes
+COORDINATES = ["lat", "lng"]
+# Grains whose merged sketches the cube keeps: the trend's, and the scatter plot's per category
+QUANTILE_GRAINS = [("YEAR",), ("YEAR", "JOB_TITLE"), ("YEAR", "EMPLOYER_NAME")]
+
+
+@dataclass(frozen=True)
+class Cube:
+    # DIMENSIONS + COORDINATES, count, wage_sum; sorted by YEAR and labeled by cell id
+    cells: pd.DataFrame
+    sketches: pd.DataFrame  # cell, bucket, n; sorted by cell
+    accuracy: float
+    # QUANTILE_GRAINS tuple -> grain dimensions, bucket, n; sorted by YEAR
+    grains: dict = field(default_factory=dict)
+
+
+def build_cube(df, accuracy=DEFAULT_ACCURACY):
+    """Aggregate the prepared petition rows into a cube."""
+    grouped = df.groupby(DIMENSIONS + COORDINATES, observed=True, dropna=False)
+    cells = grouped.agg(count=("PREVAILING_WAGE", "size"),
+                        wage_sum=("PREVAILING_WAGE", "sum")).reset_index()
+    cells["wage_sum"] = cells["wage_sum"].astype("float64")
+    cell = pd.DataFrame({"cell": grouped.ngroup().to_numpy("int32")})
+    wages = df["PREVAILING_WAGE"].to_numpy()
+    sketches = build_sketches(cell, wages, accuracy)
+    grains = {grain: build_sketches(df[list(grain)].reset_index(drop=True), wages, accuracy)
+              for grain in QUANTILE_GRAINS}
+    return Cube(cells, sketches, accuracy, grains)
+
+
+def merge_cube(cube, df):
+    """Cube of the cube's petitions plus the prepared rows `df` (e.g. newly appended ones).
+
+    Only the YEARs `df` touches are re-aggregated: their cells are regrouped with the new
+    rows' cells, and the cells of every other year are kept and only relabeled. The result
+    is the cube `build_cube` would give for all the rows together.
+    """
+    delta = build_cube(df, cube.accuracy)
+    old, new = cube.cells.copy(deep=False), delta.cells.copy(deep=False)
+    for name in DIMENSIONS[1:]:
+        categories = old[name].cat.categories.union(new[name].cat.categories)
+        old[name] = old[name].cat.set_categories(categories)
+        new[name] = new[name].cat.set_categories(categories)
+    # Source cell ids: the old labels, then the new cells' labels shifted past them
+    offset = int(old.index.max()) + 1 if len(old) else 0
+    old["source"] = old.index.to_numpy()
+    new["source"] = new.index.to_numpy() + offset
+
+    touched = old["YEAR"].isin(new["YEAR"].unique()).to_numpy()
+    combined = pd.concat([old[touched], new], ignore_index=True)
+    grouped = combined.groupby(DIMENSIONS + COORDINATES, observed=True, dropna=False)
+    merged = grouped[["count", "wage_sum"]].sum().reset_index()
+    merged["group"] = np.arange(len(merged))
+    kept = old[~touched].assign(group=-1)
+
+    cells = pd.concat([kept, merged], ignore_index=True).sort_values("YEAR", kind="stable")
+    # Relabel in row order, so each YEAR's cells stay a contiguous run of ids
+    label = np.arange(len(cells))
+    ids = np.full(offset + len(new), -1, dtype=np.int64)
+    is_kept = cells["group"].to_numpy() < 0
+    ids[cells["source"].to_numpy()[is_kept].astype(np.int64)] = label[is_kept]
+    group_label = np.empty(len(merged), dtype=np.int64)
+    group_label[cells["group"].to_numpy()[~is_kept]] = label[~is_kept]
+    ids[combined["source"].to_numpy()] = group_label[grouped.ngroup().to_numpy()]
+
+    shifted = delta.sketches.assign(cell=delta.sketches["cell"] + offset)
+    sketches = pd.concat([cube.sketches, shifted], ignore_index=True)
+    sketches["cell"] = ids[sketches["cell"].to_numpy()].astype(np.int32)
+    cells = cells.drop(columns=["source", "group"]).reset_index(drop=True)
+
+    grains = {}
+    for grain, old_grain in cube.grains.items():
+        parts = [old_grain.copy(deep=False), delta.grains[grain].copy(deep=False)]
+        for name in grain[1:]:
+            for part in parts:
+                part[name] = part[name].cat.set_categories(cells[name].cat.categories)
+        grains[grain] = merge_sketches(pd.concat(parts, ignore_index=True), list(grain))
+    return Cube(cells, merge_sketches(sketches, ["cell"]), cube.accuracy, grains)
+
+
+def select_years(cube, years):
+    """Sub-cube restricted to the given YEARs (e.g. a brush selection).
+
+    Cells and sketches are both sorted by YEAR, so this slices them rather than scanning.
+    """
+    spans = year_spans(cube.cells["YEAR"].to_numpy(), years)
+    # Each span of cells covers a contiguous run of cell ids, found in the sketches by bisection
+    labels = cube.cells.index.to_numpy()
+    sketch_cells = cube.sketches["cell"].to_numpy()
+    sketch_spans = [(np.searchsorted(sketch_cells, labels[start], side="left"),
+                     np.searchsorted(sketch_cells, labels[stop - 1], side="right"))
+                    for start, stop in spans]
+    return Cube(take_spans(cube.cells, spans), take_spans(cube.sketches, sketch_spans),
+                cube.accuracy,
+                {grain: take_years(sketches, years) for grain, sketches in cube.grains.items()})
+
+
+def totals(cube, by):
+    """Petition count and wage total per group of `by`, indexed by the group.
+
+    Large cubes are summed in row ranges on several cores and the partial totals added up.
+    """
+    def partial(cells):
+        return cells.groupby(by, observed=True)[["count", "wage_sum"]].sum()
+
+    def combine(parts):
+        return pd.concat(parts).groupby(level=by, observed=True).sum()
+
+    return map_reduce(partial, cube.cells, combine)
+
+
+def rollup(cube, by, measure="count", name=None):
+    """Petition `count`, wage `sum` or wage `mean` per group of `by`, as a column named `name`."""
+    sums = totals(cube, by)
+    if measure == "count":
+        values = sums["count"]
+    elif measure == "sum":
+        values = sums["wage_sum"]
+    elif measure == "mean":
+        values = sums["wage_sum"] / sums["count"]
+    else:
+        raise ValueError(f"Unknown measure: {measure!r}")
+    return values.reset_index(name=name or measure)
+
+
+def rollup_quantile(cube, by, q=0.5, name=None):
+    """Approximate wage quantile per group of `by`.
+
+    Merged from the smallest of the cube's grain sketches that covers `by`, else from the
+    cell sketches; large cubes merge those in row ranges on several cores first.
+    """
+    covering = [sketches for grain, sketches in cube.grains.items() if set(by) <= set(grain)]
+    if covering:
+        sketches = min(covering, key=len)
+    else:
+        def partial(sketches):
+            keys = cube.cells.loc[sketches["cell"], by].reset_index(drop=True)
+            return merge_sketches(
+                pd.concat([keys, sketches[["bucket", "n"]].reset_index(drop=True)], axis=1), by)
+
+        def combine(parts):
+            return merge_sketches(pd.concat(parts, ignore_index=True), by)
+
+        sketches = map_reduce(partial, cube.sketches, combine)
+    result = sketch_quantile(sketches, by, q, cube.accuracy)
+    return result.rename(columns={"value": name or "quantile"})
@@ -0,0 +1,176 @@
+"""Loading and preparation of the H1B petition dataset.
+
+The prepared dataset and its cubes live in one store per source CSV pair, shared by every
+session. When the petitions CSV only grew by appended rows (e.g. a new fiscal year), the
+store folds just those rows in (see `h1b.ingest.ingest_append` and `h1b.cube.merge_cube`);
+any other change, or a change to us_cities.csv, rebuilds it from scratch.
+
+Each prepared version and its cubes are also published as memory-mapped stores (see
+`h1b.shared`), which every server process on the host attaches to instead of holding (or
+preparing) its own copy, and which a restarted server picks up instead of starting cold.
+"""
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, field
+
+import streamlit as st
+
+from h1b import instrument
+from h1b.cube import QUANTILE_GRAINS, Cube, build_cube, merge_cube
+from h1b.ingest import (CACHE_DIR, CITY_DTYPES, PREPARE_REVISION, concat_chunks, file_version,
+                        ingest, ingest_append, read_source)
+from h1b.shared import attach, publish
+from h1b.sketch import DEFAULT_ACCURACY
+
+H1B_PATH = "h1b_data.csv"
+CITY_PATH = "us_cities.csv"
+
+
+@dataclass
+class _Dataset:
+    version: tuple  # data_version the dataset was prepared from
+    prepared: object  # prepared DataFrame
+    state: object  # IngestState of the petitions CSV
+    cubes: dict = field(default_factory=dict)  # accuracy -> Cube
+
+
+@dataclass
+class _Store:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    dataset: _Dataset = None
+
+
+@st.cache_resource(show_spinner=False)
+def _store(h1b_path, city_path, outliers_by):
+    return _Store()
+
+
+def _shared_path(h1b_path, version, outliers_by, kind="prepared"):
+    stem = os.path.splitext(os.path.basename(h1b_path))[0]
+    token = hashlib.blake2b(repr(version).encode(), digest_size=8).hexdigest()
+    return os.path.join(CACHE_DIR, f"{stem}-{kind}-{outliers_by or 'all'}-{token}")
+
+
+def _share(prepared, state, path):
+    # Swap the process' own frame for the shared mapping of it, once published
+    try:
+        publish(prepared, path, state)
+    except OSError:
+        return prepared  # A read-only checkout keeps the frame private to this process
+    return attach(path)[0]
+
+
+def _cube_paths(h1b_path, version, outliers_by, accuracy):
+    # Cells, cell sketches, then the sketches of each of QUANTILE_GRAINS
+    parts = ["cells", "sketches"] + ["_".join(grain).lower() for grain in QUANTILE_GRAINS]
+    return [_shared_path(h1b_path, version, outliers_by, f"{part}{accuracy:g}")
+            for part in parts]
+
+
+def _share_cube(cube, paths):
+    frames = [cube.cells, cube.sketches] + [cube.grains[grain] for grain in QUANTILE_GRAINS]
+    try:
+        for frame, path in zip(frames, paths):
+            publish(frame, path)
+    except OSError:
+        return cube
+    return _attach_cube(paths, cube.accuracy)
+
+
+def _attach_cube(paths, accuracy):
+    stores = [attach(path) for path in paths]
+    if any(store is None for store in stores):
+        return None
+    cells, sketches, *grains = (frame for frame, _ in stores)
+    return Cube(cells, sketches, accuracy, dict(zip(QUANTILE_GRAINS, grains)))
+
+
+def _refresh(dataset, h1b_path, city_path, version, outliers_by):
+    # Attach to the version another process prepared, else fold appended petitions into the
+    # current dataset, or rebuild it
+    path = _shared_path(h1b_path, version, outliers_by)
+    with instrument.stage("dataset:attach") as stage:
+        shared = attach(path)
+        stage.rows_out = None if shared is None else len(shared[0])
+    if shared is not None:
+        return _Dataset(version, *shared)
+
+    h1b_version, city_version, _ = version
+    city_df = read_source(city_path, CITY_DTYPES, city_version)
+    appended = None
+    if dataset is not None and dataset.version[1] == city_version:
+        with instrument.stage("dataset:append") as stage:
+            appended = ingest_append(h1b_path, city_df, dataset.state, h1b_version)
+            stage.rows_out = None if appended is None or appended[0] is None else len(appended[0])
+    if appended is None:
+        prepared, state = ingest(h1b_path, city_df, h1b_version, outliers_by=outliers_by)
+        return _Dataset(version, _share(prepared, state, path), state)
+
+    delta, state = appended
+    prepared, cubes = dataset.prepared, dataset.cubes
+    if delta is not None and len(delta):
+        prepared = concat_chunks([prepared, delta])
+        if not prepared["YEAR"].is_monotonic_increasing:
+            # Appended rows of earlier years: stable, so it matches a full ingest's row order
+            prepared = prepared.sort_values("YEAR", kind="stable", ignore_index=True)
+        cubes = {accuracy: merge_cube(cube, delta) for accuracy, cube in cubes.items()}
+    cubes = {accuracy: _share_cube(cube, _cube_paths(h1b_path, version, outliers_by, accuracy))
+             for accuracy, cube in cubes.items()}
+    return _Dataset(version, _share(prepared, state, path), state, cubes)
+
+
+def _dataset(h1b_path, city_path, hash_contents, outliers_by):
+    store = _store(h1b_path, city_path, outliers_by)
+    version = data_version(h1b_path, city_path, hash_contents)
+    with store.lock:
+        if store.dataset is None or store.dataset.version != version:
+            with st.spinner("Preparing H1B dataset..."):
+                store.dataset = _refresh(store.dataset, h1b_path, city_path, version,
+                                         outliers_by)
+        return store.dataset
+
+
+def data_version(h1b_path=H1B_PATH, city_path=CITY_PATH, hash_contents=False):
+    """Version token of the dashboard data: the versions of both source CSVs and of their
+    preparation."""
+    return (file_version(h1b_path, hash_contents), file_version(city_path, hash_contents),
+            PREPARE_REVISION)
+
+
+def cube_version(h1b_path=H1B_PATH, city_path=CITY_PATH, hash_contents=False,
+                 accuracy=DEFAULT_ACCURACY, outliers_by=None):
+    """Version token of a `load_cube` cube, for the view builders' caches (see `h1b.views`):
+    the data version plus the outlier cut and the sketch accuracy the cube was built with."""
+    return data_version(h1b_path, city_path, hash_contents) + (outliers_by, accuracy)
+
+
+def load_prepared_data(h1b_path=H1B_PATH, city_path=CITY_PATH, hash_contents=False,
+                       outliers_by=None):
+    """Prepared dataset, refreshed whenever the version of the source CSVs changes.
+
+    Wage outliers are cut against all petitions, or per `outliers_by` group (e.g. "YEAR").
+    The frame is shared by every session and process, and its columns are read-only memory
+    maps: filter it into new frames, never assign into it.
+    """
+    return _dataset(h1b_path, city_path, hash_contents, outliers_by).prepared
+
+
+def load_cube(h1b_path=H1B_PATH, city_path=CITY_PATH, hash_contents=False,
+              accuracy=DEFAULT_ACCURACY, outliers_by=None):
+    """Aggregate cube of the prepared dataset, refreshed along with it.
+
+    `accuracy` is the relative error bound of the cube's wage quantile sketches.
+    """
+    dataset = _dataset(h1b_path, city_path, hash_contents, outliers_by)
+    with _store(h1b_path, city_path, outliers_by).lock:
+        if accuracy not in dataset.cubes:
+            paths = _cube_paths(h1b_path, dataset.version, outliers_by, accuracy)
+            cube = _attach_cube(paths, accuracy)
+            if cube is None:
+                with st.spinner("Aggregating H1B cube..."), \
+                        instrument.stage("cube:build", rows_in=len(dataset.prepared)) as stage:
+                    cube = _share_cube(build_cube(dataset.prepared, accuracy), paths)
+                    stage.rows_out = len(cube.cells)
+            dataset.cubes[accuracy] = cube
+        return dataset.cubes[accuracy]
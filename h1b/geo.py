@@ -0,0 +1,140 @@
+"""Geocoding of petitions and level-of-detail binning of the city map."""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class CityIndex:
+    keys: pd.MultiIndex  # (city, state_name), normalized like the petitions' CITY/STATE
+    lat: np.ndarray  # float32, aligned with keys
+    lng: np.ndarray
+
+
+def build_city_index(city_df):
+    """Coordinate lookup over a normalized city table (city, state_name, lat, lng).
+
+    A city listed more than once keeps its first coordinates, so the lookup can never
+    duplicate petitions the way a merge on non-unique keys does.
+    """
+    city_df = city_df.drop_duplicates(["city", "state_name"])
+    return CityIndex(pd.MultiIndex.from_arrays([city_df["city"], city_df["state_name"]]),
+                     city_df["lat"].to_numpy(np.float32), city_df["lng"].to_numpy(np.float32))
+
+
+def geocode(city, state, index):
+    """float32 (lat, lng) arrays for categorical CITY/STATE Series, NaN where unmatched.
+
+    Only the distinct (CITY, STATE) code pairs are looked up by name; each petition then
+    gets its coordinates by integer indexing.
+    """
+    city_codes = city.cat.codes.to_numpy(np.int64)
+    state_codes = state.cat.codes.to_numpy(np.int64)
+    pairs = city_codes * len(state.cat.categories) + state_codes
+    pairs[(city_codes < 0) | (state_codes < 0)] = -1  # Missing CITY or STATE
+    unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+
+    city_codes, state_codes = np.divmod(np.maximum(unique_pairs, 0), len(state.cat.categories))
+    position = index.keys.get_indexer(pd.MultiIndex.from_arrays([
+        city.cat.categories[city_codes], state.cat.categories[state_codes]]))
+    position[unique_pairs < 0] = -1
+
+    lat = np.append(index.lat, np.float32("nan"))[position][inverse]
+    lng = np.append(index.lng, np.float32("nan"))[position][inverse]
+    return lat, lng
+
+
+def unmatched_cities(df):
+    """Petitions per (CITY, STATE) that have no coordinates, most frequent first.
+
+    Works on the prepared rows (one petition each) or on cube cells (with a `count` column).
+    """
+    unmatched = df[df["lat"].isna()]
+    weights = unmatched["count"] if "count" in unmatched else pd.Series(1, index=unmatched.index)
+    return (weights.groupby([unmatched["CITY"], unmatched["STATE"]], observed=True, dropna=False)
+            .sum().sort_values(ascending=False).rename("petitions").reset_index())
+
+
+# Map levels of detail, finest first: grid cells of the given size in degrees, then states
+MAP_LEVELS = {"0.25° grid": 0.25, "0.5° grid": 0.5, "1° grid": 1.0, "2° grid": 2.0, "state": None}
+
+
+@dataclass(frozen=True)
+class MapLevel:
+    name: str
+    bins: np.ndarray  # bin of each city in MapLevels.keys
+    lat: np.ndarray  # position of each bin: mean of its cities' coordinates
+    lng: np.ndarray
+
+
+@dataclass(frozen=True)
+class MapLevels:
+    keys: pd.MultiIndex  # (CITY, STATE) of every geocoded city
+    levels: list  # MapLevel per MAP_LEVELS entry
+
+
+def build_map_levels(cells):
+    """Precompute the bin of every geocoded city at each level of detail."""
+    cities = cells[["CITY", "STATE", "lat", "lng"]].dropna().drop_duplicates(["CITY", "STATE"])
+    lat = cities["lat"].to_numpy(np.float64)
+    lng = cities["lng"].to_numpy(np.float64)
+    levels = []
+    for name, size in MAP_LEVELS.items():
+        if size is None:
+            bins = cities["STATE"].cat.codes.to_numpy()
+        else:
+            bins = np.floor(lat / size).astype(np.int64) * 10_000 + np.floor(lng / size).astype(np.int64)
+        bins, _ = pd.factorize(bins)
+        members = np.bincount(bins)
+        levels.append(MapLevel(name, bins,
+                               (np.bincount(bins, lat) / members).astype(np.float32),
+                               (np.bincount(bins, lng) / members).astype(np.float32)))
+    return MapLevels(pd.MultiIndex.from_arrays([cities["CITY"], cities["STATE"]]), levels)
+
+
+def bin_cities(city_totals, map_levels, max_points, by=()):
+    """Aggregate per-city totals into the finest level of detail with at most `max_points` bins.
+
+    `city_totals` has CITY, STATE, lat, lng, count and wage_sum columns. Returns the frame
+    in the same layout (a bin is labelled by its busiest city) and the level's name, or the
+    input unchanged and None when it is small enough already.
+
+    With `by` columns (e.g. YEAR), `city_totals` has a row per city and group; the level and
+    the bin labels are chosen on the cities' overall totals, and the bins are summed per
+    group, with the `by` columns first.
+    """
+    by = list(by)
+    cities = city_totals
+    if by:
+        cities = city_totals.groupby(["CITY", "STATE"], observed=True, sort=False)[
+            ["count", "wage_sum"]].sum().reset_index()
+    if len(cities) <= max_points:
+        return city_totals, None
+    position = map_levels.keys.get_indexer(
+        pd.MultiIndex.from_arrays([cities["CITY"], cities["STATE"]]))
+    for level in map_levels.levels:
+        bins = level.bins[position]
+        if len(np.unique(bins)) <= max_points:
+            break  # Otherwise falls through to the coarsest level
+
+    binned = cities.assign(bin=bins).sort_values("count", ascending=False)
+    grouped = binned.groupby("bin", sort=False)
+    busiest = grouped[["CITY", "STATE"]].first()
+    members = grouped.size()
+    label = busiest["CITY"].astype(str).where(members == 1, busiest["CITY"].astype(str) + " +"
+                                              + (members - 1).astype(str) + " more")
+    if by:
+        position = map_levels.keys.get_indexer(
+            pd.MultiIndex.from_arrays([city_totals["CITY"], city_totals["STATE"]]))
+        grouped = city_totals.assign(bin=level.bins[position]).groupby(by + ["bin"],
+                                                                       observed=True)
+    totals = grouped[["count", "wage_sum"]].sum()
+    groups = totals.index.to_frame(index=False)
+    return pd.DataFrame({**{column: groups[column] for column in by},
+                         "CITY": label.loc[groups["bin"]].to_numpy(),
+                         "STATE": busiest["STATE"].astype(str).loc[groups["bin"]].to_numpy(),
+                         "lat": level.lat[groups["bin"]],
+                         "lng": level.lng[groups["bin"]],
+                         "count": totals["count"].to_numpy(),
+                         "wage_sum": totals["wage_sum"].to_numpy()}), level.name
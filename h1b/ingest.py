@@ -0,0 +1,435 @@
+"""Ingestion of the source CSVs: compact dtypes, Parquet caching and chunked preparation.
+
+Sources are read in chunks of `CHUNK_ROWS` rows. A first pass converts each chunk to
+compact dtypes, appends it to the Parquet cache and folds its wage moments into running
+totals. A second pass cleans and geocodes each chunk and keeps only the rows within the
+outlier cutoff. The full file never exists in memory as parsed strings, and outliers are
+never copied: peak memory is one chunk plus the compact (categorical-coded) prepared rows.
+
+When new petitions are appended to the CSV (e.g. a new fiscal year), `ingest_append` reads
+and prepares only the appended rows, as long as the wage cutoffs they move do not move past
+any of the rows already ingested.
+"""
+import contextlib
+import hashlib
+import io
+import itertools
+import os
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+from h1b import instrument
+from h1b.geo import build_city_index, geocode
+from h1b.stats import merge_moments, moments, zscores
+
+CACHE_DIR = ".h1b_cache"
+CHUNK_ROWS = 500_000
+Z_CUTOFF = 3  # Petitions whose wage is this many standard deviations from the mean are dropped
+TAIL_BYTES = 4096
+# Revision of what preparation makes of the source rows; bumping it keeps caches of data
+# prepared the old way from being reused (see `h1b.data.data_version`)
+PREPARE_REVISION = 1
+
+# Compact dtypes for the columnar cache: dimensions as categoricals, measures as small numerics
+H1B_DTYPES = {"YEAR": "int16",
+              "STATE": "category",
+              "CITY": "category",
+              "JOB_TITLE": "category",
+              "EMPLOYER_NAME": "category",
+              "PREVAILING_WAGE": "float32"}
+CITY_DTYPES = {"city": "category",
+               "state_name": "category",
+               "lat": "float32",
+               "lng": "float32"}
+
+
+def file_version(path, hash_contents=False):
+    """Version token for a source file: its mtime and size, plus a content hash if requested.
+
+    Hashing reads the whole file, so it is opt-in for deployments where mtimes are unreliable
+    (e.g. files copied into a container image).
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if hash_contents:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        version += (digest.hexdigest(),)
+    return version
+
+
+def _arrow_schema(dtypes):
+    # Fixed index width, so every chunk's dictionary columns share one Parquet schema
+    types = {"category": pa.dictionary(pa.int32(), pa.string()),
+             "int16": pa.int16(),
+             "float32": pa.float32()}
+    return pa.schema([(name, types[dtype]) for name, dtype in dtypes.items()])
+
+
+def _cache_path(path, version, cache_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    token = hashlib.blake2b(repr(version).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"{stem}-{token}.parquet")
+
+
+def _write_through(chunks, cache_path, dtypes):
+    """Yield `chunks` while writing them to a Parquet file at `cache_path`.
+
+    The file only appears (replacing caches of older versions) once every chunk was written.
+    Processes that write the same cache concurrently each write their own temporary file, and
+    the last one to finish wins.
+    """
+    schema = _arrow_schema(dtypes)
+    cache_dir, name = os.path.split(cache_path)
+    writer = None
+    try:
+        os.makedirs(cache_dir or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=cache_dir or ".")
+        os.close(fd)
+        writer = pq.ParquetWriter(tmp_path, schema)
+    except OSError:
+        pass  # A read-only checkout still works, it just re-parses the CSV on a cold start
+    complete = False
+    try:
+        for chunk in chunks:
+            if writer is not None:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield chunk
+        complete = True
+    finally:
+        if writer is not None:
+            writer.close()
+            if complete:
+                with contextlib.suppress(FileNotFoundError):
+                    # Gone if another process replaced the cache and cleaned up first: theirs
+                    # holds the same rows
+                    os.replace(tmp_path, cache_path)
+                stem = name.rsplit("-", 1)[0]
+                for other in os.listdir(cache_dir or "."):
+                    if (other.rsplit("-", 1)[0] == stem and other != name
+                            and not other.endswith(".tmp")):  # Other writers' files in progress
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(os.path.join(cache_dir, other))
+            else:
+                os.remove(tmp_path)
+
+
+def _read_cache(cache_path, chunk_rows):
+    for batch in pq.ParquetFile(cache_path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+class _ByteRange(io.RawIOBase):
+    # The bytes of an open file from its position up to `stop`, as a file of their own
+    def __init__(self, f, stop):
+        self._f, self._left = f, stop - f.tell()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._f.readinto(memoryview(buffer)[:max(self._left, 0)])
+        self._left -= n
+        return n
+
+
+def _line_end(f, start, stop):
+    # Offset just past the last line break in [start, stop), or `start` if there is none
+    position = stop
+    while position > start:
+        block_start = max(position - (1 << 16), start)
+        f.seek(block_start)
+        newline = f.read(position - block_start).rfind(b"\n")
+        if newline >= 0:
+            return block_start + newline + 1
+        position = block_start
+    return start
+
+
+def _read_csv(path, dtypes, chunk_rows, offset=0, version=None):
+    """Rows of the CSV from byte `offset` up to its size in `version` (a `file_version`).
+
+    Rows appended since are left for the next version. A last line without a line break may
+    still be being written, so it is only read if the file is still at `version` after the
+    other rows were.
+    """
+    if version is None:
+        version = file_version(path)
+    # From `offset` on, the CSV has no header line: take the column names from the first line
+    names = list(pd.read_csv(path, nrows=0).columns)
+    with open(path, "rb") as f:
+        end = _line_end(f, offset, version[1])
+
+        def rows(start, stop, header):
+            f.seek(start)
+            for chunk in pd.read_csv(io.BufferedReader(_ByteRange(f, stop)),
+                                     header=0 if header else None,
+                                     names=None if header else names,
+                                     usecols=list(dtypes), dtype=dtypes, chunksize=chunk_rows):
+                yield chunk[list(dtypes)]
+
+        if end > offset:
+            yield from rows(offset, end, header=offset == 0)
+        if 0 < end < version[1] and file_version(path)[:2] == version[:2]:
+            yield from rows(end, version[1], header=False)
+
+
+def iter_source(path, dtypes, version=None, cache_dir=CACHE_DIR, chunk_rows=CHUNK_ROWS):
+    """Chunks of a source CSV with the given compact dtypes, served from its Parquet cache.
+
+    On first use (or after the CSV's version changes) the CSV itself is read, and each chunk
+    is appended to a new cache file as it goes; the cache only replaces the stale one once
+    the whole CSV was read. Only the columns in `dtypes` are kept.
+    """
+    if version is None:
+        version = file_version(path)
+    cache_path = _cache_path(path, version, cache_dir)
+    if os.path.exists(cache_path):
+        yield from _read_cache(cache_path, chunk_rows)
+    else:
+        yield from _write_through(_read_csv(path, dtypes, chunk_rows, version=version),
+                                  cache_path, dtypes)
+
+
+def concat_chunks(chunks):
+    """Concatenate chunks whose categorical columns each have their own categories."""
+    chunks = list(chunks)
+    columns = {}
+    for name, dtype in chunks[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[name] = union_categoricals([chunk[name] for chunk in chunks],
+                                               sort_categories=True)
+        else:
+            columns[name] = np.concatenate([chunk[name].to_numpy() for chunk in chunks])
+    return pd.DataFrame(columns)
+
+
+def read_source(path, dtypes, version=None, cache_dir=CACHE_DIR, chunk_rows=CHUNK_ROWS):
+    """Whole source CSV with compact dtypes (see `iter_source`)."""
+    return concat_chunks(iter_source(path, dtypes, version, cache_dir, chunk_rows))
+
+
+def map_categories(s, func):
+    """Apply a string function to the categories of a categorical Series instead of every row.
+
+    Categories that collapse onto the same value (e.g. "BOSTON" and "BOSTON ") are merged,
+    and the result's categories stay sorted.
+    """
+    categories = pd.Index(func(s.cat.categories.to_series()))
+    unique = categories.unique().sort_values()
+    codes = unique.get_indexer(categories)[s.cat.codes]
+    codes[s.cat.codes.to_numpy() == -1] = -1
+    return pd.Series(pd.Categorical.from_codes(codes, unique), index=s.index, name=s.name)
+
+
+def canonical_names(names):
+    """Job title or employer names in one spelling: upper case, without periods and
+    apostrophes, other punctuation and runs of whitespace as one space ("&", "+" and "#"
+    are kept, e.g. "AT & T", "C++").
+
+    So "Google, Inc.", "GOOGLE INC" and "google  inc" are all "GOOGLE INC".
+    """
+    return (names.str.upper()
+            .str.replace(r"[.']", "", regex=True)
+            .str.replace("&", " & ", regex=False)
+            .str.replace(r"[^\w&+#]+", " ", regex=True)
+            .str.strip())
+
+
+def city_index(city_df):
+    """Coordinate lookup for us_cities.csv, with names normalized like the petitions'."""
+    city_df = city_df.copy(deep=False)
+    for name in ["city", "state_name"]:
+        city_df[name] = map_categories(city_df[name].astype("category"),
+                                       lambda c: c.str.strip().str.upper())
+    return build_city_index(city_df)
+
+
+def prepare_chunk(df, index):
+    """Clean a chunk of raw petitions and attach city coordinates from a `city_index`."""
+    # Shallow copy: columns are replaced or added below, never written into
+    df = df.copy(deep=False)
+    df["STATE"] = map_categories(df["STATE"].astype("category"), lambda c: c.str.strip())
+    df["CITY"] = map_categories(df["CITY"].astype("category"), lambda c: c.str.strip())
+    # Spelling variants of a job title or employer become one category
+    df["JOB_TITLE"] = map_categories(df["JOB_TITLE"].astype("category"), canonical_names)
+    df["EMPLOYER_NAME"] = map_categories(df["EMPLOYER_NAME"].astype("category"),
+                                         canonical_names)
+
+    # Attach city coordinates by integer lookup on the (CITY, STATE) codes
+    df["lat"], df["lng"] = geocode(df["CITY"], df["STATE"], index)
+    return df
+
+
+def _outlier_keys(df, outliers_by):
+    # One group for a global cutoff, else e.g. one per YEAR
+    return np.zeros(len(df), dtype=np.int8) if outliers_by is None else df[outliers_by].to_numpy()
+
+
+def wage_moments(chunks, outliers_by=None):
+    """Moments of PREVAILING_WAGE over all chunks, per `outliers_by` group if given."""
+    result = None
+    for chunk in chunks:
+        result = merge_moments(result, moments(chunk["PREVAILING_WAGE"],
+                                               _outlier_keys(chunk, outliers_by)))
+    return result
+
+
+def drop_outliers(df, wage_moments, outliers_by=None, z_cutoff=Z_CUTOFF):
+    """Rows of a chunk whose wage z-score is under the cutoff (missing wages are dropped)."""
+    z = zscores(df["PREVAILING_WAGE"], _outlier_keys(df, outliers_by), wage_moments)
+    return df[z < z_cutoff]
+
+
+def prepare_data(df, city_df, outliers_by=None, z_cutoff=Z_CUTOFF):
+    """Clean in-memory raw petitions, attach city coordinates and drop wage outliers.
+
+    Outliers are judged against all petitions, or within each `outliers_by` group (e.g.
+    "YEAR") if given. The result is sorted by YEAR.
+    """
+    df = drop_outliers(prepare_chunk(df, city_index(city_df)),
+                       wage_moments([df], outliers_by), outliers_by, z_cutoff)
+    # Keep the rows sorted by YEAR so a year selection is a slice (see h1b.partition)
+    return df.sort_values("YEAR", kind="stable", ignore_index=True)
+
+
+@dataclass(frozen=True)
+class IngestState:
+    """What `ingest_append` needs to know about the CSV content ingested so far."""
+    version: tuple  # file_version of the CSV when ingested
+    size: int  # bytes ingested
+    tail: str  # digest of the last TAIL_BYTES ingested, to recognize the same prefix
+    moments: pd.DataFrame  # wage moments of every ingested row, per outlier group
+    margins: pd.DataFrame  # see _margins, per outlier group
+    outliers_by: str
+    z_cutoff: float
+
+
+def _tail_digest(path, size):
+    with open(path, "rb") as f:
+        f.seek(max(size - TAIL_BYTES, 0))
+        tail = f.read(size - max(size - TAIL_BYTES, 0))
+    # A final newline means an append starts a fresh line rather than continuing one
+    return hashlib.blake2b(tail, digest_size=16).hexdigest() if tail.endswith(b"\n") else None
+
+
+def _margins(df, wage_moments, outliers_by, z_cutoff):
+    # Per group, the extreme kept wages and the dropped wages closest to the cutoff on
+    # either side: the rows that would change sides first if the cutoff moved
+    wage = df["PREVAILING_WAGE"].to_numpy(np.float64)
+    keys = _outlier_keys(df, outliers_by)
+    z = zscores(wage, keys, wage_moments)
+    below = wage < wage_moments["mean"].reindex(keys).to_numpy()
+    with np.errstate(invalid="ignore"):
+        kept, dropped = z < z_cutoff, z >= z_cutoff
+    grouped = pd.DataFrame({"kept": np.where(kept, wage, np.nan),
+                            "low": np.where(dropped & below, wage, np.nan),
+                            "high": np.where(dropped & ~below, wage, np.nan)}).groupby(keys)
+    return pd.DataFrame({"kept_min": grouped["kept"].min(), "kept_max": grouped["kept"].max(),
+                         "dropped_low": grouped["low"].max(),
+                         "dropped_high": grouped["high"].min()})
+
+
+def _merge_margins(margins):
+    return pd.concat(margins).groupby(level=0).agg(
+        {"kept_min": "min", "kept_max": "max", "dropped_low": "max", "dropped_high": "min"})
+
+
+def _prepare_chunks(chunks, index, wage_moments, outliers_by, z_cutoff):
+    # Second pass over the petitions: prepared rows and margins of each chunk
+    parts, margins = [], []
+    for chunk in chunks:
+        prepared = prepare_chunk(chunk, index)
+        parts.append(drop_outliers(prepared, wage_moments, outliers_by, z_cutoff))
+        margins.append(_margins(chunk, wage_moments, outliers_by, z_cutoff))
+    return parts, margins
+
+
+def ingest(h1b_path, city_df, version=None, cache_dir=CACHE_DIR, chunk_rows=CHUNK_ROWS,
+           outliers_by=None, z_cutoff=Z_CUTOFF):
+    """Prepared dataset for a petitions CSV (as `prepare_data`), built in two chunked passes.
+
+    Returns the dataset and the `IngestState` to fold later appends into it with.
+    """
+    if version is None:
+        version = file_version(h1b_path)
+
+    def chunks():
+        return iter_source(h1b_path, H1B_DTYPES, version, cache_dir, chunk_rows)
+
+    with instrument.stage("ingest:load+moments"):
+        stats = wage_moments(chunks(), outliers_by)
+    with instrument.stage("ingest:merge+zscore", rows_in=int(stats["count"].sum())) as stage:
+        parts, margins = _prepare_chunks(chunks(), city_index(city_df), stats, outliers_by,
+                                         z_cutoff)
+        df = concat_chunks(parts)
+        stage.rows_out = len(df)
+    size = version[1]
+    state = IngestState(version, size, _tail_digest(h1b_path, size), stats,
+                        _merge_margins(margins), outliers_by, z_cutoff)
+    with instrument.stage("ingest:sort", rows_in=len(df)):
+        return df.sort_values("YEAR", kind="stable", ignore_index=True), state
+
+
+def ingest_append(h1b_path, city_df, state, version=None, cache_dir=CACHE_DIR,
+                  chunk_rows=CHUNK_ROWS):
+    """Prepare only the rows appended to a CSV since it was ingested with `state`.
+
+    Returns the prepared new rows (None if no complete row was added) and the new state, or
+    None when the CSV changed in another way or when the appended wages move an outlier
+    cutoff past a row ingested before; the dataset then has to be ingested from scratch.
+    Otherwise the old rows plus the new ones are exactly what `ingest` would give.
+    """
+    if version is None:
+        version = file_version(h1b_path)
+    if (state.tail is None or version[1] <= state.size
+            or _tail_digest(h1b_path, state.size) != state.tail):
+        return None
+
+    def appended():
+        return _read_csv(h1b_path, H1B_DTYPES, chunk_rows, state.size, version)
+
+    # First pass: wage moments of the new rows, writing the new version's Parquet cache as
+    # the old cache followed by the new rows (when there is an old cache to extend)
+    stats = state.moments
+
+    def tallied():
+        nonlocal stats
+        for chunk in appended():
+            stats = merge_moments(stats, moments(chunk["PREVAILING_WAGE"],
+                                                 _outlier_keys(chunk, state.outliers_by)))
+            yield chunk
+
+    chunks = tallied()
+    old_cache = _cache_path(h1b_path, state.version, cache_dir)
+    if os.path.exists(old_cache):
+        chunks = _write_through(itertools.chain(_read_cache(old_cache, chunk_rows), chunks),
+                                _cache_path(h1b_path, version, cache_dir), H1B_DTYPES)
+    for _ in chunks:
+        pass
+
+    # The old rows keep their sides of the moved cutoffs if their margins do
+    margins = state.margins
+    keys = margins.index.to_numpy()
+    z = {name: zscores(margins[name], keys, stats) for name in margins}
+    with np.errstate(invalid="ignore"):
+        if ((z["kept_min"] >= state.z_cutoff) | (z["kept_max"] >= state.z_cutoff)
+                | (z["dropped_low"] < state.z_cutoff) | (z["dropped_high"] < state.z_cutoff)).any():
+            return None
+
+    # Second pass: prepare the new rows against the updated cutoffs
+    parts, new_margins = _prepare_chunks(appended(), city_index(city_df), stats,
+                                         state.outliers_by, state.z_cutoff)
+    size = version[1]
+    new_state = IngestState(version, size, _tail_digest(h1b_path, size), stats,
+                            _merge_margins([margins] + new_margins),
+                            state.outliers_by, state.z_cutoff)
+    return (concat_chunks(parts) if parts else None), new_state
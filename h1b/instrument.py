@@ -0,0 +1,167 @@
+"""Opt-in instrumentation of the dashboard's stages: wall time, rows, memory and cache use.
+
+`start` begins recording a rerun; each `stage` block run afterwards (in the same thread, or
+in tasks that carry a copy of its context, see `h1b.views.gather`) adds a `StageRecord` to
+the rerun's `Recorder`. Without `start`, a stage costs a context variable lookup. A stage
+opened inside another one records it as its `parent`, so only top-level stages add up to
+the rerun's time.
+
+Every stage also counts into process-wide Prometheus-style counters, which
+`prometheus_text` renders in the text exposition format (e.g. for node_exporter's textfile
+collector), and `Recorder.finish` logs the rerun's records as JSON lines on the
+"h1b.instrument" logger.
+
+Memory is traced with `tracemalloc` while recording, which slows allocation-heavy code
+down; it is the net growth of traced memory over a stage, i.e. what the stage allocated and
+still held when it ended. Stages running concurrently see each other's allocations.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_recorder = contextvars.ContextVar("h1b_recorder", default=None)
+_cache_notes = contextvars.ContextVar("h1b_cache_notes", default=None)
+_current_stage = contextvars.ContextVar("h1b_stage", default=None)
+
+_counters = defaultdict(float)  # (metric, labels) -> value
+_counters_lock = threading.Lock()
+
+
+@dataclass
+class StageRecord:
+    stage: str
+    seconds: float
+    rows_in: int = None
+    rows_out: int = None
+    bytes: int = None  # net traced allocation
+    cache: str = None  # "memory", "disk" or "miss" for cached stages
+    parent: str = None  # the enclosing stage, None for top-level stages
+
+
+class Recorder:
+    """The stage records of one rerun."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def frame(self):
+        return pd.DataFrame([asdict(record) for record in self.records],
+                            columns=list(StageRecord.__dataclass_fields__)).astype(
+            {"rows_in": "Int64", "rows_out": "Int64", "bytes": "Int64"})
+
+    def seconds(self):
+        """Wall time of the top-level stages; nested stages are part of their parent's."""
+        with self._lock:
+            return sum(record.seconds for record in self.records if record.parent is None)
+
+    def finish(self, metrics_path=None):
+        """Log the records, and write the counters to `metrics_path` if given."""
+        for record in self.records:
+            logger.info(json.dumps(asdict(record)))
+        if metrics_path:
+            write_metrics(metrics_path)
+
+
+def start():
+    """Record the stages of the current rerun into a new `Recorder`, which is returned."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    recorder = Recorder()
+    _recorder.set(recorder)
+    return recorder
+
+
+def note_cache(result):
+    """Tell the enclosing cached stage how its result was found: "disk" or "miss"."""
+    notes = _cache_notes.get()
+    if notes is not None:
+        notes.append(result)
+
+
+class _Stage:
+    rows_out = None
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None, cached=False):
+    """Time the block as stage `name`; set `.rows_out` on the yielded object to record it.
+
+    For a `cached` stage, the cache is reported as a "memory" hit unless code inside it
+    calls `note_cache` (see `h1b.persist`).
+    """
+    info = _Stage()
+    recorder = _recorder.get()
+    if recorder is None:
+        yield info
+        return
+    notes = []
+    token = _cache_notes.set(notes)
+    parent = _current_stage.get()
+    stage_token = _current_stage.set(name)
+    traced = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - start_time
+        _current_stage.reset(stage_token)
+        _cache_notes.reset(token)
+        cache = None
+        if cached:
+            cache = "miss" if "miss" in notes else "disk" if "disk" in notes else "memory"
+        record = StageRecord(name, round(seconds, 6), rows_in, info.rows_out,
+                             max(tracemalloc.get_traced_memory()[0] - traced, 0), cache,
+                             parent)
+        recorder.add(record)
+        _count(record)
+
+
+def _count(record):
+    labels = (("stage", record.stage),)
+    with _counters_lock:
+        _counters["h1b_stage_runs_total", labels] += 1
+        _counters["h1b_stage_seconds_total", labels] += record.seconds
+        if record.rows_out is not None:
+            _counters["h1b_stage_rows_total", labels] += record.rows_out
+        if record.cache is not None:
+            _counters["h1b_cache_requests_total", labels + (("result", record.cache),)] += 1
+
+
+def prometheus_text():
+    """The counters of every stage run in this process, in Prometheus' text format."""
+    with _counters_lock:
+        counters = sorted(_counters.items())
+    lines = []
+    previous = None
+    for (metric, labels), value in counters:
+        if metric != previous:
+            lines.append(f"# TYPE {metric} counter")
+            previous = metric
+        label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+        lines.append(f"{metric}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    """Atomically write `prometheus_text` to `path`."""
+    directory = os.path.dirname(path) or "."
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+        f.write(prometheus_text())
+    os.replace(f.name, path)
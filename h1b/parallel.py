@@ -0,0 +1,51 @@
+"""Thread pools that spread the dashboard's aggregations over the server's cores.
+
+Once the brush is known, the panels' view data are independent of each other, so `gather`
+computes them concurrently; within a panel, `map_reduce` splits a large frame into row
+ranges that are aggregated concurrently and then combined. Threads rather than processes:
+the pandas/NumPy kernels doing the work (groupby reductions, sorts, takes) release the GIL
+for most of it, and threads share the cached cube instead of pickling it to each worker.
+"""
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+WORKERS = os.cpu_count() or 1
+# Frames with fewer rows than this per worker are aggregated in one piece
+MIN_SPLIT_ROWS = 250_000
+
+
+@functools.cache
+def _executor(role):
+    # Separate pools for whole tasks and for their parts, so a task waiting on its parts
+    # can never hold the threads those parts need
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix=f"h1b-{role}")
+
+
+def gather(tasks, workers=WORKERS):
+    """Run the callables in a {name: callable} dict concurrently; returns {name: result}.
+
+    With a single worker the tasks simply run in turn.
+    """
+    if workers < 2 or len(tasks) < 2:
+        return {name: task() for name, task in tasks.items()}
+    futures = {name: _executor("task").submit(task) for name, task in tasks.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def map_reduce(func, frame, combine, min_rows=MIN_SPLIT_ROWS, workers=WORKERS):
+    """`func` over row ranges of `frame` concurrently, its results merged with `combine`.
+
+    `combine` takes the list of partial results, in row order. A frame too small to be
+    worth splitting is passed to `func` whole, so `func(frame)` must already be a complete
+    result. The row ranges are slices, so the frame's data is not copied.
+    """
+    parts = min(workers, len(frame) // min_rows)
+    if parts < 2:
+        return func(frame)
+    bounds = np.linspace(0, len(frame), parts + 1).astype(int)
+    futures = [_executor("part").submit(func, frame.iloc[start:stop])
+               for start, stop in zip(bounds[:-1], bounds[1:])]
+    return combine([future.result() for future in futures])
@@ -0,0 +1,39 @@
+"""YEAR partitioning of YEAR-sorted frames.
+
+The prepared dataset and the cube cells are kept sorted by YEAR, so the rows of any set of
+years are a few contiguous row ranges found by binary search. A brush (a contiguous run of
+years) then selects a single zero-copy slice instead of scanning and copying the whole frame
+with `isin`, and a scattered selection copies only the selected rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+def year_spans(sorted_years, years):
+    """(start, stop) row ranges holding `years` in a sorted YEAR array, adjacent ranges merged."""
+    years = np.unique(np.asarray(years))
+    starts = np.searchsorted(sorted_years, years, side="left")
+    stops = np.searchsorted(sorted_years, years, side="right")
+    spans = []
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if start == stop:
+            continue  # Year not in the data
+        if spans and spans[-1][1] == start:
+            spans[-1] = (spans[-1][0], stop)
+        else:
+            spans.append((start, stop))
+    return spans
+
+
+def take_spans(frame, spans):
+    """Rows of `frame` in the given row ranges; a single range is a view, not a copy."""
+    if len(spans) == 1:
+        return frame.iloc[spans[0][0]:spans[0][1]]
+    if not spans:
+        return frame.iloc[:0]
+    return pd.concat([frame.iloc[start:stop] for start, stop in spans])
+
+
+def take_years(frame, years, column="YEAR"):
+    """Rows of a YEAR-sorted frame whose YEAR is in `years`."""
+    return take_spans(frame, year_spans(frame[column].to_numpy(), years))
@@ -0,0 +1,80 @@
+"""Disk cache of view data that survives restarts and deploys.
+
+`persist` stores each result of a function as a pickle in `.h1b_cache/views/`, keyed by the
+function and its arguments. As with `st.cache_data`, arguments whose name starts with an
+underscore are left out of the key, so the data version argument is what tells results for
+different data apart. The cache keeps at most `MAX_BYTES` of results, evicting the least
+recently used ones beyond that.
+"""
+import contextlib
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+
+from h1b import instrument
+from h1b.ingest import CACHE_DIR
+
+VIEW_CACHE_DIR = os.path.join(CACHE_DIR, "views")
+MAX_BYTES = 256 * 2 ** 20
+
+
+def _evict(cache_dir, max_bytes):
+    entries = []
+    with os.scandir(cache_dir) as scan:
+        for entry in scan:
+            if entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Evicted by another process
+        total -= size
+
+
+def persist(func=None, *, cache_dir=VIEW_CACHE_DIR, max_bytes=MAX_BYTES):
+    """Decorator caching a function's results on disk (see the module docstring)."""
+    if func is None:
+        return functools.partial(persist, cache_dir=cache_dir, max_bytes=max_bytes)
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = [(name, value) for name, value in bound.arguments.items()
+               if not name.startswith("_")]
+        digest = hashlib.blake2b(pickle.dumps((func.__module__, func.__qualname__, key)),
+                                 digest_size=16).hexdigest()
+        path = os.path.join(cache_dir, f"{func.__name__}-{digest}.pickle")
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass  # Not cached (or unreadable): compute it
+        else:
+            with contextlib.suppress(OSError):  # E.g. a read-only cache: still a hit
+                os.utime(path)  # Recently used
+            instrument.note_cache("disk")
+            return result
+
+        instrument.note_cache("miss")
+        result = func(*args, **kwargs)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, path)
+            _evict(cache_dir, max_bytes)
+        except OSError:
+            pass  # A read-only checkout just doesn't persist anything
+        return result
+
+    return wrapper
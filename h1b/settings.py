@@ -0,0 +1,16 @@
+"""Dashboard settings shared by `dashboard.py`, the cache warmer (`h1b.warm`) and the
+benchmarks, so the views they compute and cache are the same ones.
+"""
+
+# Wage outliers are cut within each YEAR ("YEAR") or against all petitions (None). Per
+# year, petitions of a new year only add a group, so appending them to h1b_data.csv is
+# folded into the dataset (see h1b.ingest.ingest_append); a global cut moves with every
+# append, and some row ingested before soon changes sides, forcing a full re-ingest
+OUTLIERS_BY = "YEAR"
+# Relative error bound of the approximate (sketch-based) wage medians
+SKETCH_ACCURACY = 0.01
+# Above this many cities, the map shows grid or state bins instead of individual cities
+MAP_MAX_POINTS = 1500
+# Compute boxplot quartiles/whiskers/outliers on the server and send only those; set to
+# False to ship every value and let Vega-Lite's mark_boxplot compute them in the browser
+BOXPLOT_SERVER_STATS = True
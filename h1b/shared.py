@@ -0,0 +1,81 @@
+"""Read-only, memory-mapped frames shared by every Streamlit process on a host.
+
+`publish` writes a frame once as one .npy file per column (the codes, for categoricals),
+plus a small JSON file with the column layout and category labels. `attach` maps those
+files back into a DataFrame without copying them: the columns are views of the operating
+system's page cache, so any number of sessions and server processes (e.g. several
+`streamlit run` workers behind a load balancer) share a single copy of the data.
+
+The attached columns are read-only; writing into them raises instead of corrupting the
+data other processes see.
+"""
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+LAYOUT = "layout.json"
+EXTRA = "extra.pickle"
+
+
+def publish(frame, path, extra=None):
+    """Write `frame` (numeric and categorical columns) and a picklable `extra` to `path`.
+
+    The store appears atomically: a concurrent `attach` sees all of it or nothing, and if
+    another process published the same path first, its store is kept. Stores of other
+    versions next to it with the same name prefix (before the last "-") are removed.
+    """
+    parent, name = os.path.split(path)
+    os.makedirs(parent or ".", exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=name + ".", suffix=".tmp", dir=parent or ".")
+    layout = {"length": len(frame), "columns": []}
+    for position, (column, values) in enumerate(frame.items()):
+        entry = {"name": column, "file": f"{position}.npy"}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            entry["categories"] = values.cat.categories.tolist()
+            values = values.cat.codes
+        np.save(os.path.join(staging, entry["file"]), values.to_numpy())
+        layout["columns"].append(entry)
+    if extra is not None:
+        with open(os.path.join(staging, EXTRA), "wb") as f:
+            pickle.dump(extra, f)
+    # Written last: a store without its layout is incomplete
+    with open(os.path.join(staging, LAYOUT), "w") as f:
+        json.dump(layout, f)
+
+    try:
+        os.rename(staging, path)
+    except OSError:
+        shutil.rmtree(staging)  # Published by another process in the meantime
+        return
+    stem = name.rsplit("-", 1)[0]
+    for other in os.listdir(parent or "."):
+        if other.rsplit("-", 1)[0] == stem and other != name and not other.endswith(".tmp"):
+            # Processes still attached to it keep their mapping until they let go
+            shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+
+
+def attach(path):
+    """Frame and extra published at `path`, memory-mapped; None if there is no such store."""
+    try:
+        with open(os.path.join(path, LAYOUT)) as f:
+            layout = json.load(f)
+    except FileNotFoundError:
+        return None
+    columns = {}
+    for entry in layout["columns"]:
+        values = np.load(os.path.join(path, entry["file"]), mmap_mode="r")
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(values, pd.Index(entry["categories"]))
+        columns[entry["name"]] = values
+    # copy=False keeps every column in its own block, i.e. a view of its file
+    frame = pd.DataFrame(columns, index=pd.RangeIndex(layout["length"]), copy=False)
+    extra = None
+    if os.path.exists(os.path.join(path, EXTRA)):
+        with open(os.path.join(path, EXTRA), "rb") as f:
+            extra = pickle.load(f)
+    return frame, extra
@@ -0,0 +1,72 @@
+"""Mergeable quantile sketches for the wage measure, vectorized over many groups at once.
+
+A sketch is a long table of (group keys..., bucket, n) rows. Values are counted in
+logarithmic buckets whose width grows with the value (the DDSketch scheme), so any quantile
+read back is within a relative error of `accuracy` of the true value. Sketches of disjoint
+row sets merge by summing `n` per bucket, which is what lets a rollup or a year brush be
+answered without touching the raw rows.
+"""
+import numpy as np
+
+DEFAULT_ACCURACY = 0.01  # 1% relative error on any quantile
+
+
+def _log_gamma(accuracy):
+    return np.log((1 + accuracy) / (1 - accuracy))
+
+
+def bucket_index(values, accuracy=DEFAULT_ACCURACY):
+    """Bucket of each value. Values below 1 (no real wage is) share the lowest bucket."""
+    values = np.maximum(np.asarray(values, dtype=np.float64), 1.0)
+    return np.ceil(np.log(values) / _log_gamma(accuracy)).astype(np.int32)
+
+
+def bucket_value(index, accuracy=DEFAULT_ACCURACY):
+    """Representative value of a bucket, within `accuracy` of everything counted in it."""
+    gamma = (1 + accuracy) / (1 - accuracy)
+    return 2 * np.power(gamma, np.asarray(index, dtype=np.float64)) / (gamma + 1)
+
+
+def build_sketches(keys, values, accuracy=DEFAULT_ACCURACY):
+    """Sketch `values` per group, where `keys` is a DataFrame of group keys aligned with them.
+
+    The result is sorted by group and bucket.
+    """
+    by = list(keys.columns)
+    return (keys.assign(bucket=bucket_index(values, accuracy))
+            .groupby(by + ["bucket"], observed=True).size()
+            .reset_index(name="n"))
+
+
+def merge_sketches(sketches, by):
+    """Merge sketches into one per group of `by` by summing the bucket counts."""
+    return (sketches.groupby(by + ["bucket"], observed=True)["n"].sum()
+            .reset_index())
+
+
+def sketch_quantile(sketches, by, q=0.5, accuracy=DEFAULT_ACCURACY):
+    """Approximate `q` quantile per group of `by`, merging sketches first where needed."""
+    merged = merge_sketches(sketches, by)  # also sorts by group and bucket
+    # The merged rows are sorted by group, so each group is a run of rows: find the runs'
+    # starts rather than grouping again
+    changed = np.zeros(len(merged), dtype=bool)
+    changed[:1] = True
+    for key in by:
+        values = merged[key]
+        values = values.cat.codes.to_numpy() if values.dtype == "category" else values.to_numpy()
+        changed[1:] |= values[1:] != values[:-1]
+    starts = np.flatnonzero(changed)
+    cumulative = np.cumsum(merged["n"].to_numpy())
+    before = np.concatenate([[0], cumulative[:-1]])[starts]  # Count ahead of each group
+    rank = q * (np.diff(np.append(before, cumulative[-1:])) - 1)
+    buckets = merged["bucket"].to_numpy()
+
+    def value_at(rank):
+        # First bucket per group whose cumulative count passes the rank
+        return bucket_value(buckets[np.searchsorted(cumulative, before + rank, side="right")],
+                            accuracy)
+
+    # Interpolate between the neighbouring ranks like pandas' default quantile does
+    lower, upper = value_at(np.floor(rank)), value_at(np.ceil(rank))
+    value = lower + (rank - np.floor(rank)) * (upper - lower)
+    return merged[by].iloc[starts].reset_index(drop=True).assign(value=value)
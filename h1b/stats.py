@@ -0,0 +1,90 @@
+"""Summary statistics: streaming moments for the outlier filter, boxplot summaries."""
+import numpy as np
+import pandas as pd
+
+
+def moments(values, keys):
+    """Count, mean and M2 (sum of squared deviations) of `values` per group of `keys`.
+
+    Computed in float64 around each group's own mean, so they stay accurate for large
+    wages; moments of separate chunks combine exactly with `merge_moments`. NaNs are skipped.
+    """
+    values = pd.Series(np.asarray(values, dtype=np.float64))
+    keys = np.asarray(keys)
+    grouped = values.groupby(keys)
+    result = pd.DataFrame({"count": grouped.count(), "mean": grouped.mean()})
+    deviations = values - result["mean"].reindex(keys).to_numpy()
+    result["m2"] = (deviations ** 2).groupby(keys).sum()
+    return result
+
+
+def merge_moments(a, b):
+    """Moments of the union of two row sets from the moments of each (Chan et al.)."""
+    if a is None:
+        return b
+    a, b = a.align(b, fill_value=0)
+    a, b = a.fillna({"mean": 0}), b.fillna({"mean": 0})  # Groups with only missing values
+    count = a["count"] + b["count"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = b["mean"] - a["mean"]
+        mean = a["mean"] + delta * b["count"] / count
+        m2 = a["m2"] + b["m2"] + delta ** 2 * a["count"] * b["count"] / count
+    return pd.DataFrame({"count": count, "mean": mean.where(count > 0), "m2": m2})
+
+
+def zscores(values, keys, moments):
+    """Absolute z-scores (population std) of `values` against their group's moments.
+
+    Values in a group without spread score 0; missing values score NaN.
+    """
+    mean = moments["mean"].reindex(keys).to_numpy()
+    std = np.sqrt(moments["m2"] / moments["count"]).reindex(keys).to_numpy()
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.abs(values - mean) / std
+    z[(std == 0) & ~np.isnan(values)] = 0
+    return z
+
+
+def boxplot_stats(data, by, value, extent=1.5, max_outliers=None):
+    """Five-number summary and outliers per group, as Vega-Lite's boxplot would compute them.
+
+    Quartiles interpolate linearly, whiskers reach the most extreme values within `extent`
+    interquartile ranges of the box, and values beyond the whiskers are outliers. Returns
+    the summary (`by`, lower, q1, median, q3, upper, count, outliers) and the outlier rows
+    (`by`, `value`). With `max_outliers`, only that many outliers per group are returned, the
+    farthest from the median; the summary's `outliers` column still counts all of them.
+    """
+    outliers = data.loc[:, [by, value]].reset_index(drop=True)
+    if data.empty:
+        # E.g. a brush over years without petitions: nothing to unstack the quartiles from
+        summary = outliers[[by]].assign(**{name: pd.Series(dtype="float64") for name in
+                                           ["lower", "q1", "median", "q3", "upper"]},
+                                        count=pd.Series(dtype="int64"),
+                                        outliers=pd.Series(dtype="int64"))
+        return summary, outliers
+    grouped = data.groupby(by, observed=True)[value]
+    summary = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    summary.columns = ["q1", "median", "q3"]
+    iqr = summary["q3"] - summary["q1"]
+    low = (summary["q1"] - extent * iqr).reindex(data[by]).to_numpy()
+    high = (summary["q3"] + extent * iqr).reindex(data[by]).to_numpy()
+
+    values = data[value].to_numpy()
+    inside = (values >= low) & (values <= high)
+    within = data[inside].groupby(by, observed=True)[value]
+    summary["lower"] = within.min()
+    summary["upper"] = within.max()
+    summary["count"] = grouped.size()
+    outliers = outliers[~inside]
+    summary["outliers"] = (outliers.groupby(by, observed=True).size()
+                           .reindex(summary.index, fill_value=0))
+    if max_outliers is not None:
+        # The farthest from the median first, then back in row order
+        distance = np.abs(outliers[value].to_numpy()
+                          - summary["median"].reindex(outliers[by]).to_numpy())
+        outliers = (outliers.iloc[np.argsort(-distance, kind="stable")]
+                    .groupby(by, observed=True).head(max_outliers).sort_index())
+    summary = summary.reset_index()[[by, "lower", "q1", "median", "q3", "upper", "count",
+                                     "outliers"]]
+    return summary, outliers.reset_index(drop=True)
@@ -0,0 +1,113 @@
+"""Top-K job titles / employers by petition count or mean wage, without ranking every group.
+
+`build_rankings` precomputes, once per data version, each YEAR's totals per category value
+sorted by count and by mean wage. `top_k` then runs the threshold algorithm over the brushed
+years' rankings: it reads them in growing prefixes, totals the values seen so far exactly
+across the years, and stops as soon as no value outside the prefixes could still beat the
+current K-th best. With skewed data that is a small fraction of the groups.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from h1b.partition import year_spans
+
+
+@dataclass(frozen=True)
+class Ranking:
+    codes: np.ndarray  # category codes present, ascending
+    count: np.ndarray  # aligned with codes
+    wage_sum: np.ndarray
+    by_count: np.ndarray  # positions into codes, by count descending
+    by_mean: np.ndarray  # positions into codes, by mean wage descending
+
+
+@dataclass(frozen=True)
+class Rankings:
+    category: str
+    labels: pd.Index  # category values, indexed by code
+    overall: Ranking  # across all years, serving unbrushed queries directly
+    years: dict  # YEAR -> Ranking
+
+
+def _ranking(codes, count, wage_sum):
+    mean = wage_sum / count
+    # Ties rank by code, matching the order nlargest keeps them in
+    return Ranking(codes, count, wage_sum,
+                   np.lexsort((codes, -count)), np.lexsort((codes, -mean)))
+
+
+def build_rankings(cube, category):
+    """Per-year and overall rankings of `category` ("JOB_TITLE" or "EMPLOYER_NAME")."""
+    totals = cube.cells.groupby(["YEAR", category], observed=True)[["count", "wage_sum"]].sum()
+    years = totals.index.get_level_values("YEAR").to_numpy()
+    codes = totals.index.get_level_values(category).codes.astype(np.int64)
+    count = totals["count"].to_numpy(np.int64)
+    wage_sum = totals["wage_sum"].to_numpy(np.float64)
+
+    per_year = {}
+    for year in np.unique(years).tolist():
+        (start, stop), = year_spans(years, [year])
+        per_year[year] = _ranking(codes[start:stop], count[start:stop], wage_sum[start:stop])
+
+    overall_codes, inverse = np.unique(codes, return_inverse=True)
+    overall = _ranking(overall_codes,
+                       np.bincount(inverse, count).astype(np.int64),
+                       np.bincount(inverse, wage_sum))
+    return Rankings(category, totals.index.levels[1], overall, per_year)
+
+
+def top_k(rankings, measure="count", years=None, k=20, name=None):
+    """Top `k` values of the category by petition `count` or wage `mean` over `years`.
+
+    Returns the same frame as a full groupby followed by `nlargest(k)`: the category column
+    and the measure as a column named `name`, best first.
+    """
+    if measure not in ("count", "mean"):
+        raise ValueError(f"Unknown measure: {measure!r}")
+    if years is None:
+        lists = [rankings.overall]
+    else:
+        lists = [rankings.years[year] for year in sorted(set(years)) if year in rankings.years]
+
+    candidates = np.empty(0, dtype=np.int64)
+    values = np.empty(0)
+    depth = k
+    while lists:
+        seen = [ranking.codes[(ranking.by_count if measure == "count" else ranking.by_mean)[:depth]]
+                for ranking in lists]
+        candidates = np.unique(np.concatenate(seen))
+
+        # Exact totals of every candidate across the selected years
+        count = np.zeros(len(candidates), dtype=np.int64)
+        wage_sum = np.zeros(len(candidates))
+        for ranking in lists:
+            position = np.minimum(np.searchsorted(ranking.codes, candidates), len(ranking.codes) - 1)
+            present = ranking.codes[position] == candidates
+            count[present] += ranking.count[position[present]]
+            wage_sum[present] += ranking.wage_sum[position[present]]
+        values = count if measure == "count" else wage_sum / count
+
+        # Best value anything outside the prefixes could still reach: a sum of per-year
+        # counts, or at most the largest per-year mean
+        bounds = []
+        for ranking in lists:
+            if depth < len(ranking.codes):
+                if measure == "count":
+                    bounds.append(ranking.count[ranking.by_count[depth]])
+                else:
+                    next_ = ranking.by_mean[depth]
+                    bounds.append(ranking.wage_sum[next_] / ranking.count[next_])
+        if not bounds:
+            break  # Every ranking read to the end
+        threshold = sum(bounds) if measure == "count" else max(bounds)
+        if len(candidates) >= k and np.partition(values, len(values) - k)[len(values) - k] > threshold:
+            break
+        depth *= 4
+
+    best = np.lexsort((candidates, -values))[:k]
+    return pd.DataFrame({
+        rankings.category: pd.Categorical.from_codes(candidates[best], rankings.labels),
+        name or measure: values[best],
+    })
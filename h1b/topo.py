@@ -0,0 +1,79 @@
+"""US states TopoJSON for the map background, kept in `static/` and served by the app itself.
+
+Fetch it once where there is network access (e.g. while building the deployment image):
+
+    python -m h1b.topo
+
+This writes the us-atlas states-10m file and a simplified variant for the small map panel.
+The dashboard uses them through Streamlit's static file serving (see .streamlit/config.toml),
+so browsers never reach out to a CDN; without them it falls back to the CDN URL.
+"""
+import argparse
+import json
+import os
+import urllib.request
+
+US_ATLAS_URL = "https://cdn.jsdelivr.net/npm/us-atlas@3/states-10m.json"
+# Streamlit serves the static/ folder next to the app scripts, i.e. at the repository root
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+FULL_MAP = "states-10m.json"
+SIMPLIFIED_MAP = "states-10m-simplified.json"
+
+
+def simplify_topology(topology, factor=8):
+    """Coarser copy of a quantized TopoJSON topology.
+
+    Arc positions are snapped to a grid `factor` times coarser and points that land on the
+    same grid position as their predecessor are dropped. Arcs stay shared between the
+    features that use them, so neighbouring states still meet without gaps.
+    """
+    arcs = []
+    for arc in topology["arcs"]:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x, y = x + dx, y + dy
+            point = (round(x / factor), round(y / factor))
+            if not points or point != points[-1]:
+                points.append(point)
+        if len(points) == 1:
+            points.append(points[0])  # Keep degenerate arcs valid: two positions
+        previous = (0, 0)
+        encoded = []
+        for point in points:
+            encoded.append([point[0] - previous[0], point[1] - previous[1]])
+            previous = point
+        arcs.append(encoded)
+
+    transform = topology["transform"]
+    return dict(topology, arcs=arcs, transform={
+        "scale": [scale * factor for scale in transform["scale"]],
+        "translate": transform["translate"],
+    })
+
+
+def fetch_us_map(static_dir=STATIC_DIR, factor=8, url=US_ATLAS_URL):
+    """Download the states TopoJSON into `static_dir` along with its simplified variant."""
+    with urllib.request.urlopen(url) as response:
+        topology = json.load(response)
+    os.makedirs(static_dir, exist_ok=True)
+    for name, data in [(FULL_MAP, topology), (SIMPLIFIED_MAP, simplify_topology(topology, factor))]:
+        with open(os.path.join(static_dir, name), "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+
+def us_map_url(simplified=True, static_dir=STATIC_DIR):
+    """URL of the states TopoJSON: the app's own static copy if present, else the CDN."""
+    name = SIMPLIFIED_MAP if simplified else FULL_MAP
+    if os.path.exists(os.path.join(static_dir, name)):
+        return f"app/static/{name}"
+    return US_ATLAS_URL
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the US states TopoJSON into static/.")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    parser.add_argument("--factor", type=int, default=8,
+                        help="how much coarser the simplified variant's grid is")
+    args = parser.parse_args()
+    fetch_us_map(args.static_dir, args.factor)
@@ -0,0 +1,92 @@
+"""Compact encoding of the chart data the dashboard sends to the browser.
+
+Streamlit already ships Altair chart data as Arrow IPC buffers next to the Vega-Lite spec,
+rather than inlining JSON row records. What is left to save is in the frames themselves:
+a categorical label column carries its whole dictionary (every employer, for a top 20 bar
+chart), and coordinates or counts can be wider than needed. `compact` fixes both, and
+`report` compares the JSON records Altair would otherwise inline, today's Arrow buffers
+and the compacted ones.
+"""
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Columns whose values only position marks on the map, where float32 is plenty
+COORDINATES = ["lat", "lng"]
+
+
+def _compact_frame(frame):
+    columns = {}
+    for name, values in frame.items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.remove_unused_categories()
+        elif values.dtype == object and values.nunique() < len(values):
+            values = values.astype("category")  # Repeated labels: dictionary-encode them
+        elif name in COORDINATES:
+            values = values.astype(np.float32)
+        elif values.dtype == np.int64:
+            values = pd.to_numeric(values, downcast="integer")
+        columns[name] = values
+    return pd.DataFrame(columns, index=frame.index)
+
+
+def compact(data):
+    """View data with each DataFrame in it compacted: unused categories dropped, repeated
+    string labels dictionary-encoded, coordinates as float32 and integers narrowed.
+
+    `data` may be a DataFrame or a tuple or dict holding some; anything else is returned
+    as is. Measures keep their precision, so tooltips show the same values.
+    """
+    if isinstance(data, pd.DataFrame):
+        return _compact_frame(data)
+    if isinstance(data, tuple):
+        return tuple(compact(item) for item in data)
+    if isinstance(data, dict):
+        return {name: compact(item) for name, item in data.items()}
+    return data
+
+
+def arrow_bytes(frame):
+    """The frame as an Arrow IPC stream, as Streamlit serializes chart data."""
+    table = pa.Table.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _timed_size(func):
+    start = time.perf_counter()
+    size = len(func())
+    return size, (time.perf_counter() - start) * 1000
+
+
+def _frames(name, data):
+    if isinstance(data, pd.DataFrame):
+        yield name, data
+    elif isinstance(data, tuple):
+        for position, item in enumerate(data):
+            yield from _frames(f"{name}[{position}]", item)
+
+
+def report(**data):
+    """Payload size (bytes) and serialization time (ms) of each chart's data per encoding.
+
+    Compares JSON row records (what `Chart.to_dict()` inlines), Arrow (what Streamlit sends
+    today) and compacted Arrow. Takes view data by name, as `compact` does.
+    """
+    rows = []
+    for name, item in data.items():
+        for label, frame in _frames(name, item):
+            json_size, json_ms = _timed_size(
+                lambda: json.dumps(frame.to_dict(orient="records"), default=str))
+            arrow_size, arrow_ms = _timed_size(lambda: arrow_bytes(frame))
+            compact_size, compact_ms = _timed_size(lambda: arrow_bytes(compact(frame)))
+            rows.append({"data": label, "rows": len(frame),
+                         "json_bytes": json_size, "json_ms": json_ms,
+                         "arrow_bytes": arrow_size, "arrow_ms": arrow_ms,
+                         "compact_bytes": compact_size, "compact_ms": compact_ms})
+    return pd.DataFrame(rows)
@@ -0,0 +1,240 @@
+"""View data for the dashboard panels, memoized on each panel's real inputs.
+
+Every builder is a pure function of the cube's version (`h1b.data.cube_version`: the data
+version, outlier cut and sketch accuracy), the selected measure and category and the brushed
+YEARs (`None` when nothing is brushed, otherwise a sorted tuple). The data itself is passed
+as `_cube`/`_df`, which Streamlit leaves out of the cache key, so a rerun that
+doesn't change a panel's inputs reuses its view data. Each cache keeps at most
+`MAX_ENTRIES` results and evicts the least recently used one beyond that. Behind those
+in-memory caches, results are also kept on disk (see `h1b.persist`), so a restarted server
+serves the views it computed before without recomputing them.
+
+`gather` computes several panels' view data at once, each on its own core. The
+`year_*_totals` builders serve the crossfilter mode instead, where the browser applies the
+brush itself.
+"""
+import contextvars
+import threading
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from h1b import instrument, parallel
+from h1b.cube import rollup, rollup_quantile, select_years, totals
+from h1b.geo import bin_cities, build_map_levels, unmatched_cities
+from h1b.partition import take_years
+from h1b.persist import persist
+from h1b.stats import boxplot_stats
+from h1b.topk import build_rankings, top_k
+
+COUNT = "Count of Petitions"
+WAGE = "Prevailing Wage"
+MAX_ENTRIES = 64
+# Outliers drawn per state by the boxplot, so its data stays bounded with the categories
+MAX_OUTLIERS = 20
+# The panels below the brush (see `panel_tasks`)
+PANELS = ("bar", "geo", "scatter")
+
+
+def _select(cube, years):
+    return cube if years is None else select_years(cube, years)
+
+
+def _rollup(cube, by, measure):
+    # Petitions are counted, wages averaged
+    return rollup(cube, by, "count" if measure == COUNT else "mean", name=measure)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def trend_data(_cube, _df, version, measure, approximate=False):
+    """Petition count or median wage per YEAR (never brushed: it hosts the brush)."""
+    if measure == COUNT:
+        return rollup(_cube, ["YEAR"], "count", name=COUNT)
+    if approximate:
+        return rollup_quantile(_cube, ["YEAR"], 0.5, name=WAGE)
+    return _df.groupby("YEAR")["PREVAILING_WAGE"].median().reset_index(name=WAGE)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _rankings(_cube, version, category):
+    return build_rankings(_cube, category)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def bar_data(_cube, version, measure, category, years, k=20):
+    """Top `k` job titles or employers by the measure."""
+    return top_k(_rankings(_cube, version, category), "count" if measure == COUNT else "mean",
+                 years, k, name=measure)
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _map_levels(_cube, version):
+    return build_map_levels(_cube.cells)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def map_data(_cube, version, measure, years, max_points=None):
+    """Measure per geocoded city, or per map bin when there are more than `max_points` cities.
+
+    Returns the view data and the name of the level of detail (None for cities).
+    """
+    cities = totals(_select(_cube, years), ["CITY", "STATE", "lat", "lng"]).reset_index()
+    level = None
+    if max_points is not None:
+        cities, level = bin_cities(cities, _map_levels(_cube, version), max_points)
+    values = cities["count"] if measure == COUNT else cities["wage_sum"] / cities["count"]
+    return cities[["CITY", "STATE", "lat", "lng"]].assign(**{measure: values}), level
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def unmatched_share(_cube, version, years):
+    """Share of petitions whose city has no coordinates, which the map can't show."""
+    cells = _select(_cube, years).cells
+    total = cells["count"].sum()
+    return cells.loc[cells["lat"].isna(), "count"].sum() / total if total else 0.0
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def top_unmatched_cities(_cube, version, years, k=3):
+    """The `k` cities without coordinates with the most petitions (CITY, STATE, petitions)."""
+    return unmatched_cities(_select(_cube, years).cells).head(k)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def boxplot_data(_cube, version, measure, category, years):
+    """Measure per STATE x job title/employer, the distribution the boxplot summarizes."""
+    return _rollup(_select(_cube, years), ["STATE", category], measure)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def boxplot_summary(_cube, version, measure, category, years, max_outliers=MAX_OUTLIERS):
+    """Per-STATE boxplot statistics and outliers of `boxplot_data`, computed server-side.
+
+    The browser then draws a few rows per state instead of receiving every
+    STATE x job title/employer value and computing quartiles itself. Of the outliers, only
+    the `max_outliers` farthest from the median are sent per state.
+    """
+    return boxplot_stats(boxplot_data(_cube, version, measure, category, years), "STATE",
+                         measure, max_outliers=max_outliers)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def scatter_data(_cube, _df, version, category, years, approximate=False):
+    """Petition count and median wage per job title/employer."""
+    if approximate:
+        cube = _select(_cube, years)
+        return rollup(cube, [category], "count", name=COUNT).merge(
+            rollup_quantile(cube, [category], 0.5, name=WAGE))
+    df = _df if years is None else take_years(_df, years)
+    return df.groupby(category, observed=True).agg(
+        **{COUNT: (category, "count"),  # Count of rows
+           WAGE: ("PREVAILING_WAGE", "median")}  # Median Salary
+    ).reset_index()
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def year_category_totals(_cube, version, category):
+    """Petition count and wage total per YEAR x job title/employer, for the browser to brush."""
+    return totals(_cube, ["YEAR", category]).reset_index()
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, show_spinner=False)
+@persist
+def year_city_totals(_cube, version, max_points=None):
+    """Petition count and wage total per YEAR x geocoded city, or x map bin when there are
+    more than `max_points` cities, for the browser to brush.
+
+    Returns the totals and the name of the level of detail (None for cities).
+    """
+    cities = totals(_cube, ["YEAR", "CITY", "STATE", "lat", "lng"]).reset_index()
+    if max_points is None:
+        return cities, None
+    return bin_cities(cities, _map_levels(_cube, version), max_points, by=["YEAR"])
+
+
+def panel_tasks(cube, df, version, measure, category, chart_type, years, approximate=False,
+                map_max_points=None, boxplot_server_stats=True, panels=PANELS):
+    """View data builders of the panels below the brush, by name, ready for `gather`.
+
+    `chart_type` is "Map" or "Boxplot"; the map also reports its unmatched share and the
+    cities most of it is in. `panels` limits the builders to those of some panels: "bar",
+    "geo" (the map or boxplot) and "scatter".
+    """
+    tasks = {}
+    if "bar" in panels:
+        # Top 20 only
+        tasks["bar"] = lambda: bar_data(cube, version, measure, category, years, k=20)
+    if "scatter" in panels:
+        # Count of rows and median salary per job title / employer
+        tasks["scatter"] = lambda: scatter_data(cube, df, version, category, years, approximate)
+    if "geo" in panels:
+        if chart_type == "Map":
+            # Data for cities, and the share of petitions the map can't place and where
+            tasks["map"] = lambda: map_data(cube, version, measure, years, map_max_points)
+            tasks["unmatched"] = lambda: unmatched_share(cube, version, years)
+            tasks["unmatched_cities"] = lambda: top_unmatched_cities(cube, version, years)
+        elif boxplot_server_stats:
+            tasks["boxplot"] = lambda: boxplot_summary(cube, version, measure, category, years)
+        else:
+            tasks["boxplot"] = lambda: boxplot_data(cube, version, measure, category, years)
+    return tasks
+
+
+def crossfilter_tasks(cube, version, measure, category, chart_type, map_max_points=None,
+                      boxplot_server_stats=True):
+    """View data builders for brushing in the browser (see `h1b.charts.crossfilter`).
+
+    Instead of the panels' data for one brush, per-YEAR totals from which the browser
+    computes every panel for any brush: "categories" for the bar chart and the scatter
+    plot, and "map" (with the unbrushed "unmatched" share and cities). The boxplot needs
+    every wage rather than totals, so it stays a server-side panel, over all years:
+    "boxplot" as from `panel_tasks`.
+    """
+    tasks = {"categories": lambda: year_category_totals(cube, version, category)}
+    if chart_type == "Map":
+        tasks["map"] = lambda: year_city_totals(cube, version, map_max_points)
+        tasks["unmatched"] = lambda: unmatched_share(cube, version, None)
+        tasks["unmatched_cities"] = lambda: top_unmatched_cities(cube, version, None)
+    else:
+        # The boxplot builders use the cube only
+        tasks.update(panel_tasks(cube, None, version, measure, category, chart_type, None,
+                                 boxplot_server_stats=boxplot_server_stats, panels=["geo"]))
+    return tasks
+
+
+def gather(**tasks):
+    """Run view data builders concurrently: `gather(bar=lambda: bar_data(...), ...)`.
+
+    Returns the results by name. The worker threads run in the calling script's context, so
+    the builders' caches behave exactly as when called from the script itself, and each
+    builder is instrumented as a "panel:<name>" stage (see `h1b.instrument`), nested in a
+    "gather" stage timing them together, since they overlap.
+    """
+    ctx = get_script_run_ctx()
+
+    def attach(name, task):
+        context = contextvars.copy_context()
+
+        def instrumented():
+            with instrument.stage(f"panel:{name}", cached=True) as stage:
+                result = task()
+                data = result[0] if isinstance(result, tuple) else result
+                stage.rows_out = len(data) if hasattr(data, "__len__") else None
+            return result
+
+        def run():
+            add_script_run_ctx(threading.current_thread(), ctx)
+            return context.run(instrumented)
+        return run
+
+    with instrument.stage("gather"):  # Copied into the tasks' contexts as their parent
+        return parallel.gather({name: attach(name, task) for name, task in tasks.items()})
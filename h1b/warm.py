@@ -0,0 +1,84 @@
+"""Pre-warm the dashboard's caches before traffic arrives, e.g. right after a deploy:
+
+    python -m h1b.warm
+
+Run from the dashboard's working directory, it prepares (or attaches to) the dataset and its
+cube, then computes the view data of every measure x category x Map/Boxplot combination,
+unbrushed and brushed to each single YEAR. Everything lands in `.h1b_cache/`, where the
+dashboard's processes pick it up (see `h1b.data` and `h1b.persist`), and a timing report of
+each combination is printed. The defaults are the dashboard's (see `h1b.settings`).
+"""
+import argparse
+import itertools
+import time
+
+from h1b import views
+from h1b.data import CITY_PATH, H1B_PATH, cube_version, load_cube, load_prepared_data
+from h1b.settings import BOXPLOT_SERVER_STATS, MAP_MAX_POINTS, OUTLIERS_BY, SKETCH_ACCURACY
+
+MEASURES = [views.COUNT, views.WAGE]
+CATEGORIES = ["JOB_TITLE", "EMPLOYER_NAME"]
+CHART_TYPES = ["Map", "Boxplot"]
+
+
+def _timed(label, func):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    print(f"{label:<64} {seconds * 1000:10.1f} ms")
+    return seconds
+
+
+def warm(h1b_path=H1B_PATH, city_path=CITY_PATH, accuracy=SKETCH_ACCURACY,
+         map_max_points=MAP_MAX_POINTS, boxplot_server_stats=BOXPLOT_SERVER_STATS,
+         approximate=(False,), crossfilter=False, outliers_by=OUTLIERS_BY):
+    """Compute every common view, printing how long each took; returns the total seconds."""
+    total = _timed("load dataset",
+                   lambda: load_prepared_data(h1b_path, city_path, outliers_by=outliers_by))
+    total += _timed("load cube", lambda: load_cube(h1b_path, city_path, accuracy=accuracy,
+                                                   outliers_by=outliers_by))
+    version = cube_version(h1b_path, city_path, accuracy=accuracy, outliers_by=outliers_by)
+    df = load_prepared_data(h1b_path, city_path, outliers_by=outliers_by)
+    cube = load_cube(h1b_path, city_path, accuracy=accuracy, outliers_by=outliers_by)
+
+    brushes = [None] + [(year,) for year in sorted(df["YEAR"].unique().tolist())]
+    for approx, measure in itertools.product(approximate, MEASURES):
+        suffix = " (approx.)" if approx else ""
+        total += _timed(f"trend: {measure}{suffix}",
+                        lambda: views.trend_data(cube, df, version, measure, approx))
+        for category, chart_type, years in itertools.product(CATEGORIES, CHART_TYPES, brushes):
+            tasks = views.panel_tasks(cube, df, version, measure, category, chart_type, years,
+                                      approx, map_max_points, boxplot_server_stats)
+            brush = "all years" if years is None else years[0]
+            total += _timed(f"{measure} x {category} x {chart_type} x {brush}{suffix}",
+                            lambda: [task() for task in tasks.values()])
+    if crossfilter:
+        for measure, category, chart_type in itertools.product(MEASURES, CATEGORIES,
+                                                               CHART_TYPES):
+            tasks = views.crossfilter_tasks(cube, version, measure, category, chart_type,
+                                            map_max_points, boxplot_server_stats)
+            total += _timed(f"crossfilter: {measure} x {category} x {chart_type}",
+                            lambda: [task() for task in tasks.values()])
+
+    print(f"{'total':<64} {total * 1000:10.1f} ms")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the H1B dashboard's caches.")
+    parser.add_argument("--h1b-path", default=H1B_PATH)
+    parser.add_argument("--city-path", default=CITY_PATH)
+    parser.add_argument("--accuracy", type=float, default=SKETCH_ACCURACY,
+                        help="relative error of the approximate medians (SKETCH_ACCURACY)")
+    parser.add_argument("--map-max-points", type=int, default=MAP_MAX_POINTS)
+    parser.add_argument("--client-boxplot", action="store_true",
+                        help="warm the browser-side boxplot data (BOXPLOT_SERVER_STATS = False)")
+    parser.add_argument("--approximate", action="store_true",
+                        help="also warm the views of the 'Approximate medians' toggle")
+    parser.add_argument("--crossfilter", action="store_true",
+                        help="also warm the per-YEAR totals of the 'Brush in the browser' toggle")
+    args = parser.parse_args()
+    warm(args.h1b_path, args.city_path, args.accuracy, args.map_max_points,
+         BOXPLOT_SERVER_STATS and not args.client_boxplot,
+         (False, True) if args.approximate else (False,),
+         args.crossfilter)
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Import h1b and benchmarks from the checkout, as the benchmarks do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_chunk, write_cities_csv  # noqa: E402
+from h1b.ingest import CITY_DTYPES, prepare_data  # noqa: E402
+from h1b.settings import OUTLIERS_BY  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def city_df(tmp_path_factory):
+    """The synthetic us_cities.csv, read with the dashboard's dtypes."""
+    path = tmp_path_factory.mktemp("cities") / "us_cities.csv"
+    write_cities_csv(path)
+    return pd.read_csv(path, dtype=CITY_DTYPES)
+
+
+@pytest.fixture(scope="session")
+def prepared(city_df):
+    """Synthetic petitions prepared as the dashboard prepares them."""
+    return prepare_data(make_chunk(20_000), city_df, OUTLIERS_BY)
@@ -0,0 +1,64 @@
+"""Geocoding and map binning against the plain pandas operations they replace."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from h1b.cube import build_cube, totals
+from h1b.geo import MAP_LEVELS, bin_cities, build_map_levels, geocode
+from h1b.ingest import city_index
+
+
+def test_geocode_matches_a_merge(prepared, city_df):
+    # A city listed twice keeps its first coordinates; missing names stay unmatched
+    cities = pd.concat([city_df, city_df.iloc[:50].assign(lat=0.0, lng=0.0)],
+                       ignore_index=True).astype({"city": "category", "state_name": "category"})
+    petitions = prepared[["CITY", "STATE"]].copy()
+    petitions.loc[::97, "CITY"] = None
+    petitions.loc[::89, "STATE"] = None
+
+    lat, lng = geocode(petitions["CITY"], petitions["STATE"], city_index(cities))
+
+    table = cities.assign(city=cities["city"].str.strip().str.upper(),
+                          state_name=cities["state_name"].str.strip().str.upper())
+    table = table.drop_duplicates(["city", "state_name"])
+    expected = petitions.astype(str).merge(table, how="left", left_on=["CITY", "STATE"],
+                                           right_on=["city", "state_name"])
+    assert len(expected) == len(petitions)
+    np.testing.assert_array_equal(lat, expected["lat"].to_numpy(np.float32))
+    np.testing.assert_array_equal(lng, expected["lng"].to_numpy(np.float32))
+    assert np.isnan(lat).any() and not np.isnan(lat).all()
+
+
+@pytest.fixture(scope="module")
+def cube(prepared):
+    return build_cube(prepared)
+
+
+@pytest.mark.parametrize("max_points", [1, 50, 500])
+def test_bin_cities_preserves_totals(cube, max_points):
+    cities = totals(cube, ["CITY", "STATE", "lat", "lng"]).reset_index()
+    assert len(cities) > max_points
+    binned, level = bin_cities(cities, build_map_levels(cube.cells), max_points)
+
+    assert level in MAP_LEVELS
+    assert len(binned) <= max_points or level == "state"
+    assert list(binned.columns) == list(cities.columns)
+    assert binned["count"].sum() == cities["count"].sum()
+    assert binned["wage_sum"].sum() == pytest.approx(cities["wage_sum"].sum())
+
+
+def test_bin_cities_by_year_preserves_yearly_totals(cube):
+    cities = totals(cube, ["YEAR", "CITY", "STATE", "lat", "lng"]).reset_index()
+    binned, level = bin_cities(cities, build_map_levels(cube.cells), 500, by=["YEAR"])
+
+    assert level not in (None, "state")
+    assert binned.groupby(["lat", "lng"]).ngroups <= 500
+    expected = cities.groupby("YEAR")[["count", "wage_sum"]].sum()
+    result = binned.groupby("YEAR")[["count", "wage_sum"]].sum()
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_bin_cities_keeps_few_cities(cube):
+    cities = totals(cube, ["CITY", "STATE", "lat", "lng"]).reset_index()
+    binned, level = bin_cities(cities, build_map_levels(cube.cells), len(cities))
+    assert binned is cities and level is None
@@ -0,0 +1,34 @@
+"""Name cleaning of the ingest: one spelling per name, applied per category."""
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_chunk
+from h1b.ingest import canonical_names, map_categories
+
+
+@pytest.mark.parametrize("names, canonical", [
+    (["Google, Inc.", "GOOGLE INC", "google  inc", " Google Inc "], "GOOGLE INC"),
+    (["AT&T", "at & t", "AT & T."], "AT & T"),
+    (["O'Reilly Media", "OReilly-Media"], "OREILLY MEDIA"),
+    (["U.S. Bank", "US  BANK"], "US BANK"),
+    (["C++ Developer"], "C++ DEVELOPER"),
+    (["C# / .NET Dev"], "C# NET DEV"),
+])
+def test_canonical_names(names, canonical):
+    assert canonical_names(pd.Series(names)).tolist() == [canonical] * len(names)
+
+
+@pytest.mark.parametrize("column, func", [
+    ("JOB_TITLE", canonical_names),
+    ("STATE", lambda names: names.str.strip()),
+])
+def test_map_categories_matches_mapping_every_row(column, func):
+    s = make_chunk(5_000)[column].astype("category")
+    s[::50] = None
+    result = map_categories(s, func)
+
+    expected = func(s.astype(object))  # Missing values stay missing
+    pd.testing.assert_series_equal(result.astype(object), expected.astype(object),
+                                   check_names=False)
+    assert result.name == s.name
+    assert result.cat.categories.is_unique and result.cat.categories.is_monotonic_increasing
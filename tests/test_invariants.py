@@ -0,0 +1,115 @@
+"""Invariants the incremental paths promise: appending to the data and folding new rows into
+a cube give exactly what recomputing from scratch would."""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import YEARS, make_chunk, write_cities_csv
+from h1b.cube import build_cube, merge_cube
+from h1b.ingest import (CITY_DTYPES, H1B_DTYPES, concat_chunks, file_version, ingest,
+                        ingest_append, prepare_data, read_source)
+from h1b.settings import OUTLIERS_BY
+
+ROWS = 5_000
+
+
+def _append(path, rows):
+    rows.to_csv(path, mode="a", header=False, index=False)
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))  # A distinct version even within the clock's resolution
+
+
+@pytest.fixture(scope="module")
+def appended(tmp_path_factory):
+    """Prepared rows before an append, the appended rows prepared by `ingest_append`, and a
+    full ingest of the CSV after the append, all with the dashboard's outlier cut."""
+    tmp_path = tmp_path_factory.mktemp("data")
+    h1b_path, city_path = tmp_path / "h1b_data.csv", tmp_path / "us_cities.csv"
+    write_cities_csv(city_path)
+    city_df = read_source(city_path, CITY_DTYPES, cache_dir=tmp_path / "cache")
+
+    make_chunk(ROWS, index=0).to_csv(h1b_path, index=False)
+    prepared, state = ingest(str(h1b_path), city_df, cache_dir=tmp_path / "cache",
+                             outliers_by=OUTLIERS_BY)
+    # The petitions of a new year
+    _append(h1b_path, make_chunk(ROWS // 5, index=1).assign(YEAR=YEARS[-1] + 1))
+
+    result = ingest_append(str(h1b_path), city_df, state, cache_dir=tmp_path / "cache")
+    assert result is not None, "a new year should not force a full ingest"
+    delta, _ = result
+    full, _ = ingest(str(h1b_path), city_df, cache_dir=tmp_path / "full",
+                     outliers_by=OUTLIERS_BY)
+    return prepared, delta, full
+
+
+def test_ingest_append_matches_full_ingest(appended):
+    prepared, delta, full = appended
+    combined = concat_chunks([prepared, delta]).sort_values("YEAR", kind="stable",
+                                                             ignore_index=True)
+    pd.testing.assert_frame_equal(combined, full)
+
+
+def _assert_cubes_equal(merged, built):
+    pd.testing.assert_frame_equal(merged.cells, built.cells)
+    pd.testing.assert_frame_equal(merged.sketches, built.sketches)
+    assert merged.grains.keys() == built.grains.keys()
+    for grain in built.grains:
+        pd.testing.assert_frame_equal(merged.grains[grain], built.grains[grain])
+
+
+def test_merge_cube_matches_build_cube(appended):
+    prepared, delta, full = appended
+    _assert_cubes_equal(merge_cube(build_cube(prepared), delta), build_cube(full))
+
+
+def test_merge_cube_into_existing_years(appended):
+    # New rows of years the cube already has, with their own categories like a delta's
+    _, _, full = appended
+    new = (full["YEAR"] >= 2020).to_numpy() & (np.arange(len(full)) % 3 == 0)
+    delta = full[new].reset_index(drop=True)
+    for name in delta.select_dtypes("category"):
+        delta[name] = delta[name].cat.remove_unused_categories()
+    _assert_cubes_equal(merge_cube(build_cube(full[~new].reset_index(drop=True)), delta),
+                        build_cube(full))
+
+
+def test_ingest_reads_only_the_versioned_bytes(tmp_path):
+    # Rows appended while an ingest runs, the last one still half written, belong to the
+    # next version: the ingest leaves them out, and the next append picks them up once
+    write_cities_csv(tmp_path / "us_cities.csv")
+    city_df = read_source(tmp_path / "us_cities.csv", CITY_DTYPES, cache_dir=tmp_path / "cache")
+    h1b_path, before_path = str(tmp_path / "h1b_data.csv"), str(tmp_path / "before.csv")
+    head = make_chunk(ROWS // 5, index=0)
+    head.to_csv(h1b_path, index=False)
+    head.to_csv(before_path, index=False)
+    version = file_version(h1b_path)
+    _append(h1b_path, make_chunk(ROWS // 10, index=1).assign(YEAR=YEARS[-1] + 1))
+    with open(h1b_path, "a") as f:
+        f.write(f"{YEARS[-1] + 1},TEXAS,CITY 1,JOB TITLE 1,EMPLOYER 1 INC,9")
+
+    prepared, state = ingest(h1b_path, city_df, version, cache_dir=tmp_path / "cache",
+                             outliers_by=OUTLIERS_BY)
+    expected, _ = ingest(before_path, city_df, cache_dir=tmp_path / "before",
+                         outliers_by=OUTLIERS_BY)
+    pd.testing.assert_frame_equal(prepared, expected)
+
+    with open(h1b_path, "a") as f:
+        f.write("0000\n")
+    _append(h1b_path, head.iloc[:0])
+    delta, _ = ingest_append(h1b_path, city_df, state, cache_dir=tmp_path / "cache")
+    full, _ = ingest(h1b_path, city_df, cache_dir=tmp_path / "full", outliers_by=OUTLIERS_BY)
+    pd.testing.assert_frame_equal(concat_chunks([prepared, delta]), full)
+
+
+def test_ingest_reads_a_last_line_without_line_break(tmp_path):
+    write_cities_csv(tmp_path / "us_cities.csv")
+    city_df = read_source(tmp_path / "us_cities.csv", CITY_DTYPES, cache_dir=tmp_path / "cache")
+    h1b_path = tmp_path / "h1b_data.csv"
+    h1b_path.write_text(make_chunk(ROWS // 5).to_csv(index=False).rstrip("\n"))
+    prepared, _ = ingest(str(h1b_path), city_df, cache_dir=tmp_path / "cache",
+                         outliers_by=OUTLIERS_BY)
+    expected = prepare_data(pd.read_csv(h1b_path, dtype=H1B_DTYPES), city_df, OUTLIERS_BY)
+    pd.testing.assert_frame_equal(prepared, expected, check_categorical=False)
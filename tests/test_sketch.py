@@ -0,0 +1,25 @@
+"""Sketch quantiles stay within their relative error bound of the exact quantiles."""
+import pandas as pd
+import pytest
+
+from h1b.sketch import build_sketches, sketch_quantile
+
+
+@pytest.mark.parametrize("accuracy", [0.05, 0.01, 0.005])
+@pytest.mark.parametrize("q", [0.1, 0.5, 0.9])
+@pytest.mark.parametrize("by", [["YEAR"], ["YEAR", "JOB_TITLE"]])
+def test_sketch_quantile_error_bound(prepared, accuracy, q, by):
+    sketches = build_sketches(prepared[by], prepared["PREVAILING_WAGE"], accuracy)
+    estimate = sketch_quantile(sketches, by, q, accuracy).set_index(by)["value"]
+    exact = prepared.groupby(by, observed=True)["PREVAILING_WAGE"].quantile(q)
+    assert len(estimate) == len(exact)
+    error = (estimate - exact.loc[estimate.index]).abs() / exact.loc[estimate.index]
+    assert error.max() <= accuracy * (1 + 1e-9)
+
+
+def test_merged_sketches_give_the_quantile_of_the_union(prepared):
+    # Rolling fine sketches up is the same as sketching the coarser groups directly
+    fine = build_sketches(prepared[["YEAR", "EMPLOYER_NAME"]], prepared["PREVAILING_WAGE"])
+    direct = build_sketches(prepared[["YEAR"]], prepared["PREVAILING_WAGE"])
+    pd.testing.assert_frame_equal(sketch_quantile(fine, ["YEAR"]),
+                                  sketch_quantile(direct, ["YEAR"]))
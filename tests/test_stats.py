@@ -0,0 +1,87 @@
+"""Summary statistics against straightforward reference computations."""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from benchmarks.synthetic import make_chunk
+from h1b.stats import boxplot_stats, merge_moments, moments, zscores
+
+
+def _vega_boxplot(values, extent=1.5):
+    # Vega-Lite's boxplot: linearly interpolated quartiles, whiskers at the most extreme
+    # values within `extent` IQRs of the box, everything beyond them an outlier
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    low, high = q1 - extent * (q3 - q1), q3 + extent * (q3 - q1)
+    inside = values[(values >= low) & (values <= high)]
+    return {"lower": inside.min(), "q1": q1, "median": median, "q3": q3,
+            "upper": inside.max(), "count": len(values)}, values[(values < low) | (values > high)]
+
+
+@pytest.mark.parametrize("extent", [1.5, 0.5])
+def test_boxplot_stats_matches_vega_lite(prepared, extent):
+    summary, outliers = boxplot_stats(prepared, "STATE", "PREVAILING_WAGE", extent)
+    assert len(summary) == prepared["STATE"].nunique()
+    for state, rows in prepared.groupby("STATE", observed=True)["PREVAILING_WAGE"]:
+        expected, expected_outliers = _vega_boxplot(rows.to_numpy(), extent)
+        row = summary.set_index("STATE").loc[state]
+        for name, value in expected.items():
+            assert row[name] == pytest.approx(value), name
+        assert row["outliers"] == len(expected_outliers)
+        # Outliers in row order, as the rows they came from
+        np.testing.assert_array_equal(
+            outliers.loc[outliers["STATE"] == state, "PREVAILING_WAGE"], expected_outliers)
+
+
+def test_boxplot_stats_keeps_the_farthest_outliers(prepared):
+    summary, everything = boxplot_stats(prepared, "STATE", "PREVAILING_WAGE")
+    _, kept = boxplot_stats(prepared, "STATE", "PREVAILING_WAGE", max_outliers=3)
+    medians = summary.set_index("STATE")["median"]
+    for state, outliers in everything.groupby("STATE", observed=True)["PREVAILING_WAGE"]:
+        distance = (outliers - medians[state]).abs()
+        expected = outliers[distance.rank(method="first", ascending=False) <= 3]
+        np.testing.assert_array_equal(
+            kept.loc[kept["STATE"] == state, "PREVAILING_WAGE"], expected)
+    assert summary["outliers"].sum() == len(everything) > len(kept)
+
+
+def test_boxplot_stats_of_no_rows(prepared):
+    summary, outliers = boxplot_stats(prepared.iloc[:0], "STATE", "PREVAILING_WAGE")
+    assert summary.empty and outliers.empty
+    assert list(summary.columns) == ["STATE", "lower", "q1", "median", "q3", "upper", "count",
+                                     "outliers"]
+
+
+@pytest.fixture(scope="module")
+def raw():
+    # Raw wages, with the extreme and missing values the outlier cut sees
+    return make_chunk(20_000)
+
+
+def _chunks(df, n=3):
+    size = -(-len(df) // n)
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+
+def test_merged_moments_match_moments_of_all_rows(raw):
+    merged = None
+    for chunk in _chunks(raw):
+        merged = merge_moments(merged, moments(chunk["PREVAILING_WAGE"], chunk["YEAR"]))
+    pd.testing.assert_frame_equal(merged, moments(raw["PREVAILING_WAGE"], raw["YEAR"]),
+                                  check_dtype=False, rtol=1e-9)
+
+
+def test_zscores_match_scipy(raw):
+    merged = None
+    for chunk in _chunks(raw):
+        merged = merge_moments(merged, moments(chunk["PREVAILING_WAGE"], chunk["YEAR"]))
+    z = zscores(raw["PREVAILING_WAGE"], raw["YEAR"], merged)
+    for year, rows in raw.groupby("YEAR")["PREVAILING_WAGE"]:
+        expected = np.abs(stats.zscore(rows.to_numpy(), nan_policy="omit"))
+        np.testing.assert_allclose(z[raw["YEAR"] == year], expected, rtol=1e-9)
+
+
+def test_zscores_of_a_group_without_spread():
+    values, keys = np.array([5.0, 5.0, np.nan, 1.0, 3.0]), np.array([1, 1, 1, 2, 2])
+    z = zscores(values, keys, moments(values, keys))
+    np.testing.assert_array_equal(z, [0, 0, np.nan, 1, 1])
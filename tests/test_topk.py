@@ -0,0 +1,35 @@
+"""`top_k` returns exactly what ranking every group with a groupby would."""
+import pandas as pd
+import pytest
+
+from h1b.cube import build_cube, select_years
+from h1b.topk import build_rankings, top_k
+
+
+@pytest.fixture(scope="module")
+def cube(prepared):
+    return build_cube(prepared)
+
+
+@pytest.mark.parametrize("category", ["JOB_TITLE", "EMPLOYER_NAME"])
+@pytest.mark.parametrize("measure", ["count", "mean"])
+@pytest.mark.parametrize("years", [None, (2015,), (2019, 2020, 2021), tuple(range(2012, 2024))])
+@pytest.mark.parametrize("k", [3, 20])
+def test_top_k_matches_nlargest(cube, category, measure, years, k):
+    cells = cube.cells if years is None else select_years(cube, years).cells
+    sums = cells.groupby(category, observed=True)[["count", "wage_sum"]].sum()
+    values = sums["count"] if measure == "count" else sums["wage_sum"] / sums["count"]
+    expected = values.nlargest(k).rename(measure).reset_index()
+
+    result = top_k(build_rankings(cube, category), measure, years, k)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_top_k_of_years_without_petitions(cube):
+    result = top_k(build_rankings(cube, "JOB_TITLE"), "count", (1999,), 5)
+    assert result.empty and list(result.columns) == ["JOB_TITLE", "count"]
+
+
+def test_top_k_rejects_unknown_measures(cube):
+    with pytest.raises(ValueError):
+        top_k(build_rankings(cube, "JOB_TITLE"), "median")